@@ -0,0 +1 @@
+"""Data layer for the Airbnb New York dashboard."""
@@ -0,0 +1,107 @@
+"""Precomputed aggregate cube behind the dashboard charts.
+
+Every grouping set of borough x neighbourhood x room_type, plus the
+neighbourhood polygon rollup, is aggregated once per dataset version with the
+listing count and the sum, mean and quantiles of each measure. Charts then
+read small frames from the cube instead of grouping the full listings frame on
+every rerun.
+
+The quantiles of the borough x neighbourhood x room_type rollups are merged
+from per-cell sketches (``airbnb/sketches.py``, within ``ALPHA`` relative
+error) instead of sorting the listings once per grouping set; pass exact
+sketches to get ``groupby().quantile()`` values.
+"""
+import itertools
+
+import pandas as pd
+
+from airbnb.sketches import CellSketches, percentile_label
+
+DIMENSIONS = ["neighbourhood_group", "neighbourhood", "room_type"]
+
+MEASURES = ["price", "minimum_nights", "number_of_reviews", "reviews_per_month", "availability_365",
+            "distance_to_nearest_subway"]
+
+QUANTILES = [.1, .25, .5, .75, .9, .99]
+
+EXTRA_GROUPINGS = [("polygon_id",)]
+
+
+def grouping_sets(dimensions=DIMENSIONS):
+    """All subsets of ``dimensions``, from the grand total to the full cell."""
+    return [combo for size in range(len(dimensions) + 1) for combo in itertools.combinations(dimensions, size)]
+
+
+def quantile_column(measure, q):
+    return "%s_q%s" % (measure, ("%g" % (q * 100)).replace(".", "_"))
+
+
+class AggregateCube:
+    """Count, sum, mean and quantiles of each measure for every grouping set."""
+
+    def __init__(self, df, dimensions=DIMENSIONS, measures=MEASURES, quantiles=QUANTILES,
+                 extra_groupings=EXTRA_GROUPINGS, sketches=None):
+        self.measures = [m for m in measures if m in df]
+        self.quantiles = quantiles
+        self.tables = {}
+        dimensions = [dim for dim in dimensions if dim in df]
+        if sketches is None:
+            sketches = CellSketches(df, dimensions, self.measures)
+        for grouping in grouping_sets(dimensions):
+            self.tables[frozenset(grouping)] = self._aggregate(df, list(grouping), sketches)
+        for grouping in extra_groupings:
+            if all(col in df for col in grouping):
+                self.tables[frozenset(grouping)] = self._aggregate(df, list(grouping))
+
+    def _quantiles(self, sketches, dims):
+        """Quantile columns of the ``dims`` rollup, merged from the cell sketches."""
+        labels = {percentile_label(q): q for q in self.quantiles}
+        columns = []
+        for measure in self.measures:
+            described = sketches.describe(measure, dims, self.quantiles)
+            described = described.set_index(dims) if dims else described
+            columns.append(described[list(labels)].rename(columns=lambda l: quantile_column(measure, labels[l])))
+        return pd.concat(columns, axis=1)
+
+    def _aggregate(self, df, dims, sketches=None):
+        values = df[dims + self.measures]
+        if dims:
+            grouped = values.groupby(dims, observed=True)[self.measures]
+            stats = [grouped.size().rename("count"),
+                     grouped.sum().add_suffix("_sum"),
+                     grouped.mean().add_suffix("_mean")]
+            if sketches is not None:
+                stats.append(self._quantiles(sketches, dims))
+            else:
+                for q in self.quantiles:
+                    stats.append(grouped.quantile(q).rename(columns=lambda m: quantile_column(m, q)))
+            return pd.concat(stats, axis=1).reset_index()
+
+        row = {"count": len(values)}
+        merged = self._quantiles(sketches, dims).iloc[0] if sketches is not None else None
+        for measure in self.measures:
+            row[measure + "_sum"] = values[measure].sum()
+            row[measure + "_mean"] = values[measure].mean()
+            for q in self.quantiles:
+                column = quantile_column(measure, q)
+                row[column] = merged[column] if merged is not None else values[measure].quantile(q)
+        return pd.DataFrame([row])
+
+    def has(self, dims):
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        return frozenset(dims) in self.tables
+
+    def table(self, dims=()):
+        """All statistics for one grouping set, with the dimensions as columns."""
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        return self.tables[frozenset(dims)]
+
+    def frame(self, dims, measure, stat="mean"):
+        """``dims`` plus one statistic named after its measure.
+
+        Shaped like ``df.groupby(dims)[measure].<stat>().reset_index()``;
+        ``measure="count"`` gives the group sizes.
+        """
+        dims = [dims] if isinstance(dims, str) else list(dims)
+        column = "count" if measure == "count" else "%s_%s" % (measure, stat)
+        return self.table(dims)[dims + [column]].rename(columns={column: measure})
@@ -0,0 +1,228 @@
+"""Read-only HTTP/JSON API serving the dashboard aggregates.
+
+    python -m airbnb.api [--host 127.0.0.1] [--port 8600]
+
+Serves the same numbers as the dashboard from the same data layer: the
+memory-mapped dataset and its aggregate cube (the warm-up snapshot when there
+is one). Every response carries the dataset and code versions as its ETag, so
+clients revalidate with ``If-None-Match`` and get a 304 until the dataset is
+rebuilt or the API is restarted on changed code.
+Response bodies are serialised once per version and query.
+
+    GET /version
+    GET /aggregates?by=neighbourhood_group,room_type&measure=price&stat=mean
+    GET /price/neighbourhoods
+    GET /availability/percentiles?expensive=0
+    GET /room-types
+    GET /subway/distance
+    GET /crime/totals
+    GET /hosts/top?by=reviews&k=10
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+
+import pandas as pd
+from aiohttp import web
+
+from airbnb.aggregates import AggregateCube, quantile_column
+from airbnb.availability import AvailabilityTables
+from airbnb.dataset import ARTIFACT_PATH, CSV_PATH, dataset_version, load_dataset
+from airbnb.hosts import HostRanking
+from airbnb.warmup import code_version, load_snapshot
+
+HOST = "127.0.0.1"
+PORT = 8600
+
+# Serialised bodies kept per dataset version
+MAX_RESPONSES = 1024
+
+MAX_HOSTS = 1000
+
+log = logging.getLogger(__name__)
+
+
+class NotFound(LookupError):
+    """The dataset has nothing to answer this view with, e.g. it was built without one of its columns."""
+
+
+class DataLayer:
+    """The dataset and its indexes for one dataset version."""
+
+    def __init__(self, version, path=ARTIFACT_PATH, csv_path=CSV_PATH):
+        self.version = version
+        self.df = load_dataset(path, csv_path)
+        cube = load_snapshot("aggregates", version)
+        self.cube = cube if cube is not None else AggregateCube(self.df)
+        self.availability = AvailabilityTables(self.df)
+        self.hosts = HostRanking(self.df)
+        self.responses = collections.OrderedDict()
+
+
+class Datasets:
+    """Current ``DataLayer``, reloaded in a worker thread when the dataset version changes."""
+
+    def __init__(self, path=ARTIFACT_PATH, csv_path=CSV_PATH):
+        self.path = path
+        self.csv_path = csv_path
+        self.data = None
+        self._lock = asyncio.Lock()
+
+    async def current(self):
+        version = dataset_version(self.path, self.csv_path)
+        if self.data is not None and self.data.version == version:
+            return self.data
+        async with self._lock:
+            if self.data is None or self.data.version != version:
+                loop = asyncio.get_running_loop()
+                self.data = await loop.run_in_executor(None, DataLayer, version, self.path, self.csv_path)
+                log.info("loaded dataset version %s", version)
+        return self.data
+
+
+def split(value):
+    return [part for part in value.split(",") if part] if value else []
+
+
+def aggregates_view(data, query):
+    by = split(query.get("by"))
+    measure = query.get("measure", "count")
+    stat = query.get("stat", "mean")
+    if not data.cube.has(by):
+        raise ValueError("no aggregate for by=%s" % ",".join(by))
+    if measure != "count" and "%s_%s" % (measure, stat) not in data.cube.table(by):
+        raise ValueError("no statistic %r of %r" % (stat, measure))
+    return data.cube.frame(by, measure, stat)
+
+
+def price_neighbourhoods_view(data, query):
+    return data.cube.frame(["neighbourhood_group", "neighbourhood"], "price").round(2)\
+        .sort_values("price", ascending=False)
+
+
+def availability_view(data, query):
+    expensive = query.get("expensive", "0")
+    if expensive not in ("0", "1"):
+        raise ValueError("expensive must be 0 or 1")
+    return data.availability.table(expensive == "1")
+
+
+def room_types_view(data, query):
+    counts = data.cube.frame(["neighbourhood_group", "room_type"], "count")
+    share = counts["count"] / counts.groupby("neighbourhood_group", observed=True)["count"].transform("sum")
+    return counts.assign(percentage=(100 * share).round(2))
+
+
+def subway_distance_view(data, query):
+    measure = "distance_to_nearest_subway"
+    columns = ["count", measure + "_mean"] + [quantile_column(measure, q) for q in data.cube.quantiles]
+    return data.cube.table("neighbourhood_group")[["neighbourhood_group"] + columns].round(3)
+
+
+def crime_totals_view(data, query):
+    if "crimes" not in data.df:
+        raise NotFound("the dataset was built without crime totals")
+    return data.df[["neighbourhood_group", "crimes"]].drop_duplicates("neighbourhood_group")\
+        .sort_values("crimes", ascending=False)
+
+
+def top_hosts_view(data, query):
+    try:
+        k = int(query.get("k", 10))
+    except ValueError:
+        raise ValueError("k must be an integer")
+    if not 1 <= k <= MAX_HOSTS:
+        raise ValueError("k must be between 1 and %d" % MAX_HOSTS)
+    return data.hosts.top(k, query.get("by", "reviews"))
+
+
+def version_view(data, query):
+    return {"rows": len(data.df)}
+
+
+ROUTES = {
+    "/version": version_view,
+    "/aggregates": aggregates_view,
+    "/price/neighbourhoods": price_neighbourhoods_view,
+    "/availability/percentiles": availability_view,
+    "/room-types": room_types_view,
+    "/subway/distance": subway_distance_view,
+    "/crime/totals": crime_totals_view,
+    "/hosts/top": top_hosts_view,
+}
+
+
+def to_json(version, value):
+    data = value.to_json(orient="records") if isinstance(value, pd.DataFrame) else json.dumps(value)
+    return '{"version": %s, "data": %s}' % (json.dumps(version), data)
+
+
+def render(view, data, query):
+    return to_json(data.version, view(data, query)).encode()
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an ``If-None-Match`` header names ``etag``, by weak comparison (RFC 7232), or is ``*``."""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def handle(request):
+    view = ROUTES.get(request.path)
+    if view is None:
+        return error(404, "unknown path; one of: " + ", ".join(ROUTES))
+
+    data = await request.app["datasets"].current()
+    # The code version too, so a restart with changed views never revalidates a stale body
+    headers = {"ETag": '"%s-%s"' % (data.version, code_version()), "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("If-None-Match", ""), headers["ETag"]):
+        return web.Response(status=304, headers=headers)
+
+    key = (request.path, tuple(sorted(request.query.items())))
+    body = data.responses.get(key)
+    if body is None:
+        # Views run pandas code, kept off the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            body = await loop.run_in_executor(None, render, view, data, dict(request.query))
+        except ValueError as e:
+            return error(400, str(e))
+        except NotFound as e:
+            return error(404, str(e))
+        data.responses[key] = body
+        if len(data.responses) > MAX_RESPONSES:
+            data.responses.popitem(last=False)
+    return web.Response(body=body, content_type="application/json", headers=headers)
+
+
+def make_app(path=ARTIFACT_PATH, csv_path=CSV_PATH):
+    app = web.Application()
+    app["datasets"] = Datasets(path, csv_path)
+
+    async def preload(app):
+        await app["datasets"].current()
+
+    app.on_startup.append(preload)
+    app.router.add_get("/{path:.*}", handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard aggregates as JSON.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--data", default=ARTIFACT_PATH, help="built dataset (Parquet)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    web.run_app(make_app(args.data), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Availability statistics of every borough and price band.
+
+The dashboard's availability section shows ``availability_365.describe()`` of
+one borough's available listings (at least one free day a year), either all of
+them or only those under 100 dollars, next to a histogram of the same listings
+per borough. All of it is computed here in one grouped pass per price band
+when the dataset loads; the section then only looks tables up. Histograms
+are pre-binned by day (``airbnb/histograms.py``), so any range of days is
+rebinned without the rows.
+"""
+import pandas as pd
+
+from airbnb.aggregates import QUANTILES
+from airbnb.histograms import BinnedHistogram
+
+# Exclusive upper price bound of each band
+PRICE_BANDS = {"cheap": 100, "all": None}
+
+# Bins of the default histogram, rounded to a width of 20 days over the whole year
+HISTOGRAM_BINS = 20
+
+DAYS = 365
+
+
+def price_band(expensive):
+    return "all" if expensive else "cheap"
+
+
+class AvailabilityTables:
+    """``describe()`` tables and day histograms of the available listings, per price band and borough."""
+
+    def __init__(self, df, percentiles=QUANTILES):
+        available = df.loc[df["availability_365"] >= 1, ["neighbourhood_group", "price", "availability_365"]]
+        self.boroughs = list(df["neighbourhood_group"].cat.categories)
+
+        tables, self.histograms = [], {}
+        for band, price_limit in PRICE_BANDS.items():
+            rows = available if price_limit is None else available[available["price"] < price_limit]
+            stats = rows.groupby("neighbourhood_group", observed=False)["availability_365"]\
+                .describe(percentiles=percentiles)
+            tables.append(stats.assign(price_band=band).set_index("price_band", append=True))
+
+            self.histograms[band] = BinnedHistogram(rows, "availability_365")
+        self.tables = pd.concat(tables).reorder_levels(["price_band", "neighbourhood_group"]).sort_index()
+
+    def describe(self, borough, expensive=False):
+        """One-row frame shaped like ``availability_365.describe(percentiles).to_frame().T``."""
+        table = self.tables.loc[[(price_band(expensive), borough)]]
+        return table.set_axis(["availability_365"], axis=0)
+
+    def table(self, expensive=False):
+        """``describe()`` of every borough, one row each."""
+        return self.tables.loc[price_band(expensive)].reset_index()
+
+    def histogram(self, expensive=False, low=1, high=DAYS, bins=HISTOGRAM_BINS):
+        """Listing count per borough and bin of the days in ``[low, high]``, bins as their first day."""
+        return self.histograms[price_band(expensive)].histogram(low, high, bins)
+
+    def describe_range(self, expensive=False, low=1, high=DAYS, percentiles=QUANTILES):
+        """``describe()`` of every borough's listings available ``low`` to ``high`` days."""
+        return self.histograms[price_band(expensive)].describe(low, high, percentiles)
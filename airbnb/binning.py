@@ -0,0 +1,67 @@
+"""Multi-resolution spatial bins for the map views.
+
+Listings are assigned once to square Web Mercator bins at several zoom levels
+(a bin is ``BIN_PIXELS`` screen pixels wide at its zoom). A map then gets one
+weighted centroid per occupied bin, at the finest level that fits its point
+budget, instead of one marker per listing.
+"""
+import numpy as np
+import pandas as pd
+
+ZOOM_LEVELS = range(8, 17)
+
+BIN_PIXELS = 4
+
+TILE_PIXELS = 256
+
+
+def mercator(lats, lons):
+    """Web Mercator coordinates of the points, normalised to [0, 1)."""
+    lats = np.radians(np.clip(np.asarray(lats, dtype=float), -85.05112878, 85.05112878))
+    x = (np.asarray(lons, dtype=float) + 180.) / 360.
+    y = (1. - np.log(np.tan(lats) + 1. / np.cos(lats)) / np.pi) / 2.
+    return x, y
+
+
+class SpatialBins:
+    """Bin membership of every listing at each zoom level."""
+
+    def __init__(self, df, zoom_levels=ZOOM_LEVELS, bin_pixels=BIN_PIXELS):
+        self.latitude = df["latitude"].to_numpy(dtype=float)
+        self.longitude = df["longitude"].to_numpy(dtype=float)
+        valid = np.isfinite(self.latitude) & np.isfinite(self.longitude)
+        self.valid_rows = np.flatnonzero(valid)
+
+        x, y = mercator(self.latitude[valid], self.longitude[valid])
+        self.levels = {}
+        for zoom in zoom_levels:
+            scale = TILE_PIXELS * 2 ** zoom / bin_pixels
+            cell = np.floor(x * scale).astype(np.int64) << 32 | np.floor(y * scale).astype(np.int64)
+            _, bin_ids = np.unique(cell, return_inverse=True)
+            rows = np.full(len(valid), -1, dtype=np.int64)
+            rows[valid] = bin_ids
+            self.levels[zoom] = rows
+
+    def aggregate(self, rows=None, budget=5000):
+        """Weighted bin centroids of ``rows`` (all listings by default).
+
+        Uses the finest zoom level with at most ``budget`` occupied bins; if
+        even the coarsest level has more, its heaviest ``budget`` bins are
+        kept. Returns ``latitude``, ``longitude`` and ``weight`` (listing
+        count) columns, heaviest bins first.
+        """
+        rows = self.valid_rows if rows is None else np.asarray(rows)
+        for zoom in sorted(self.levels, reverse=True):
+            bin_ids = self.levels[zoom][rows]
+            bin_ids = bin_ids[bin_ids >= 0]
+            occupied, inverse, weight = np.unique(bin_ids, return_inverse=True, return_counts=True)
+            if len(occupied) <= budget:
+                break
+
+        picked = rows[self.levels[zoom][rows] >= 0]
+        bins = pd.DataFrame({
+            "latitude": np.bincount(inverse, weights=self.latitude[picked]) / weight,
+            "longitude": np.bincount(inverse, weights=self.longitude[picked]) / weight,
+            "weight": weight,
+        })
+        return bins.sort_values("weight", ascending=False, kind="stable").head(budget).reset_index(drop=True)
@@ -0,0 +1,72 @@
+"""On-disk cache of pipeline stage outputs keyed by input fingerprints.
+
+Input files are fingerprinted by content hash. The hash is remembered with the
+file size and mtime, so an unchanged file is not read again to re-hash it.
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+CACHE_DIR = "data/cache"
+
+BLOCK_SIZE = 1 << 20
+
+
+def hash_file(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """Parquet frames and build markers stored under ``directory``."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._fingerprints_path = os.path.join(directory, "fingerprints.json")
+        if os.path.exists(self._fingerprints_path):
+            with open(self._fingerprints_path) as f:
+                self._fingerprints = json.load(f)
+        else:
+            self._fingerprints = {}
+
+    def file_fingerprint(self, path):
+        """Content hash of ``path``, re-read only when its size or mtime changed."""
+        stat = os.stat(path)
+        known = self._fingerprints.get(os.path.abspath(path))
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["hash"]
+
+        fingerprint = hash_file(path)
+        self._fingerprints[os.path.abspath(path)] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                                     "hash": fingerprint}
+        with open(self._fingerprints_path, "w") as f:
+            json.dump(self._fingerprints, f, indent=1)
+        return fingerprint
+
+    @staticmethod
+    def key(stage, **parts):
+        """Stable key for a stage run from its input fingerprints and parameters."""
+        payload = json.dumps({"stage": stage, **parts}, sort_keys=True, default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def _path(self, stage, key, extension):
+        return os.path.join(self.directory, "%s-%s.%s" % (stage, key, extension))
+
+    def load_frame(self, stage, key):
+        path = self._path(stage, key, "parquet")
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def save_frame(self, stage, key, df):
+        df.to_parquet(self._path(stage, key, "parquet"), index=False)
+
+    def has(self, stage, key):
+        return os.path.exists(self._path(stage, key, "done"))
+
+    def mark(self, stage, key):
+        open(self._path(stage, key, "done"), "w").close()
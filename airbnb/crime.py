@@ -0,0 +1,183 @@
+"""Streaming aggregation of the NYPD complaint history.
+
+The raw export is several GB, so it is read in chunks with only the columns
+we need and the year filter is applied on the raw date strings before any
+datetime parsing. Memory is bounded by the chunk size, not the file size.
+``csv_ranges`` splits the file into byte ranges of whole lines, so several
+processes can each read one range.
+
+    python -m airbnb.crime --year 2019 [--path ...] [--output crimes_2019.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import resource
+import time
+
+import pandas as pd
+
+CRIME_PATH = "data/rawData/NYPD_Complaint_Data_Historic.csv"
+
+CRIME_COLUMNS = {
+    "CMPLNT_NUM": "float64",
+    "CMPLNT_FR_DT": "str",
+    "BORO_NM": "category",
+    "OFNS_DESC": "category",
+}
+
+CHUNKSIZE = 500_000
+
+log = logging.getLogger(__name__)
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def csv_ranges(path, parts):
+    """Byte ranges splitting the rows of a CSV (header excluded) into at most ``parts`` runs of whole lines.
+
+    Assumes no quoted field spans several lines, which holds for the NYPD export.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.readline()
+        bounds = [f.tell()]
+        for i in range(1, parts):
+            # Back one byte, so a split falling on a line start keeps that line
+            f.seek(max(bounds[0] + (size - bounds[0]) * i // parts, bounds[-1]) - 1)
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+
+
+class LineRange(io.RawIOBase):
+    """The header line of a CSV followed by the bytes ``[start, stop)`` of the file."""
+
+    def __init__(self, path, start, stop):
+        self.file = open(path, "rb")
+        self.header = self.file.readline()
+        self.file.seek(start)
+        self.remaining = stop - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.header:
+            n = min(len(buffer), len(self.header))
+            buffer[:n] = self.header[:n]
+            self.header = self.header[n:]
+            return n
+        n = self.file.readinto(memoryview(buffer)[:min(len(buffer), self.remaining)])
+        self.remaining -= n
+        return n
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+def iter_complaints(path=CRIME_PATH, year=2019, columns=CRIME_COLUMNS, chunksize=CHUNKSIZE, stats=None,
+                    byte_range=None):
+    """Yield chunks of the complaints committed in ``year``.
+
+    ``CMPLNT_FR_DT`` is parsed only for rows whose raw ``MM/DD/YYYY`` string
+    ends with the year and is replaced by the parsed dates. When ``stats`` is
+    a dict, it is updated in place with the rows read and kept. With
+    ``byte_range`` (one of ``csv_ranges``), only the rows of that range are read.
+    """
+    suffix = "/%d" % year
+    source = contextlib.nullcontext(path) if byte_range is None else io.BufferedReader(LineRange(path, *byte_range))
+    with source as f:
+        for chunk in pd.read_csv(f, usecols=list(columns), dtype=columns, chunksize=chunksize):
+            rows = len(chunk)
+            chunk = chunk[chunk["CMPLNT_FR_DT"].str.endswith(suffix, na=False)]
+            chunk = chunk.assign(CMPLNT_FR_DT=pd.to_datetime(chunk["CMPLNT_FR_DT"], format="%m/%d/%Y",
+                                                             errors="coerce"))
+            chunk = chunk[chunk["CMPLNT_FR_DT"].dt.year == year]
+            if stats is not None:
+                stats["rows_read"] = stats.get("rows_read", 0) + rows
+                stats["rows_kept"] = stats.get("rows_kept", 0) + len(chunk)
+            yield chunk
+
+
+def _add(total, values):
+    counts = values.value_counts()
+    counts = counts[counts > 0]
+    counts.index = counts.index.astype(object)
+    return counts if total is None else total.add(counts, fill_value=0)
+
+
+def _finish(counts):
+    return pd.Series(dtype="int64") if counts is None else counts.astype("int64")
+
+
+def aggregate_complaints(path=CRIME_PATH, year=2019, chunksize=CHUNKSIZE):
+    """Complaint counts for ``year`` by borough, offense type and month.
+
+    Returns ``(counts, report)``: ``counts`` maps ``by_borough``,
+    ``by_offense`` and ``by_month`` to integer Series sorted like the
+    notebook's ``groupby('BORO_NM').count()``; ``report`` holds the rows
+    read and kept, elapsed seconds, throughput and peak RSS of the run.
+    """
+    start = time.perf_counter()
+    stats = {}
+    by_borough = by_offense = by_month = None
+
+    for chunk in iter_complaints(path, year, chunksize=chunksize, stats=stats):
+        chunk = chunk[chunk["CMPLNT_NUM"].notna()]
+        by_borough = _add(by_borough, chunk["BORO_NM"])
+        by_offense = _add(by_offense, chunk["OFNS_DESC"])
+        by_month = _add(by_month, chunk["CMPLNT_FR_DT"].dt.month)
+
+    counts = {
+        "by_borough": _finish(by_borough).sort_values(ascending=False),
+        "by_offense": _finish(by_offense).sort_values(ascending=False),
+        "by_month": _finish(by_month).sort_index(),
+    }
+    counts["by_borough"].index.name = "BORO_NM"
+    counts["by_offense"].index.name = "OFNS_DESC"
+    counts["by_month"].index.name = "month"
+
+    elapsed = time.perf_counter() - start
+    report = {
+        "path": path,
+        "year": year,
+        "rows_read": stats.get("rows_read", 0),
+        "rows_kept": stats.get("rows_kept", 0),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(stats.get("rows_read", 0) / elapsed) if elapsed else None,
+        "mb_per_second": round(os.path.getsize(path) / 2**20 / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    log.info("crime aggregation: %(rows_read)d rows read, %(rows_kept)d kept in %(seconds).1fs "
+             "(%(rows_per_second)s rows/s, %(mb_per_second)s MB/s, peak RSS %(peak_rss_mb).0f MB)", report)
+    return counts, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate NYPD complaints by borough, offense and month.")
+    parser.add_argument("--path", default=CRIME_PATH)
+    parser.add_argument("--year", type=int, default=2019)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--output", help="write counts and run report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    counts, report = aggregate_complaints(args.path, args.year, args.chunksize)
+
+    print(counts["by_borough"].to_string())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"counts": {name: {str(k): int(v) for k, v in series.items()} for name, series in counts.items()},
+                       "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Complaints around every listing, from a grid of the geocoded NYPD complaints.
+
+The complaints of a year are streamed (``iter_complaints``) into counts per
+cell of a square grid over New York (``CELL_METRES`` wide), per offense
+category. The complaints within a radius of a listing are then those of the
+cells whose centres lie within that radius of the listing's cell centre: a
+disc of cells, summed as one span per grid row from row-wise prefix sums.
+The disc sums of every cell take ``2 * radius / CELL_METRES + 1`` shifted
+array differences over the grid, after which all listings are answered by
+one lookup each, whatever the number of complaints. Distances are accurate
+to about half a cell diagonal.
+
+    python -m airbnb.crime_density [--year 2019] [--radius 250 500 1000] [--cell 50]
+"""
+import argparse
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from airbnb.crime import CRIME_COLUMNS, CRIME_PATH, iter_complaints
+
+# Latitude and longitude bounds of the grid; complaints outside them (missing or bad geocodes) are dropped
+BOUNDS = (40.49, 40.92, -74.27, -73.68)
+
+CELL_METRES = 50
+
+RADII_METRES = [500]
+
+# Offense groups counted on their own, on top of all complaints
+CATEGORIES = {
+    "violent": ["FELONY ASSAULT", "ROBBERY", "RAPE", "MURDER & NON-NEGL. MANSLAUGHTER",
+                "ASSAULT 3 & RELATED OFFENSES"],
+    "property": ["PETIT LARCENY", "GRAND LARCENY", "BURGLARY", "GRAND LARCENY OF MOTOR VEHICLE",
+                 "CRIMINAL MISCHIEF & RELATED OF"],
+    "drugs": ["DANGEROUS DRUGS"],
+}
+
+GEO_COLUMNS = {"Latitude": "float64", "Longitude": "float64"}
+
+METRES_PER_DEGREE = 111_195
+
+DENSITY_COLUMN = re.compile(r"crimes_(\d+)m")
+
+log = logging.getLogger(__name__)
+
+
+def density_column(radius, category=None):
+    """``crimes_500m`` for all complaints, ``crimes_500m_violent`` for a category."""
+    return "crimes_%dm" % radius + ("_" + category if category else "")
+
+
+def density_radii(columns):
+    """Radii of the ``crimes_<radius>m`` columns among ``columns``, sorted."""
+    return sorted(int(match.group(1)) for match in map(DENSITY_COLUMN.fullmatch, columns) if match)
+
+
+class ComplaintGrid:
+    """Complaint counts per grid cell, for all complaints and each offense category."""
+
+    def __init__(self, cell_metres=CELL_METRES, bounds=BOUNDS, categories=CATEGORIES):
+        self.cell_metres = cell_metres
+        self.lat_min, lat_max, self.lon_min, lon_max = bounds
+        self.dlat = cell_metres / METRES_PER_DEGREE
+        self.dlon = self.dlat / np.cos(np.radians((self.lat_min + lat_max) / 2))
+        self.shape = (int(np.ceil((lat_max - self.lat_min) / self.dlat)),
+                      int(np.ceil((lon_max - self.lon_min) / self.dlon)))
+        self.categories = list(categories)
+        self.category_codes = {offense: code for code, name in enumerate(self.categories, start=1)
+                               for offense in categories[name]}
+        # Layer 0 counts every complaint, layer i the complaints of category i
+        self.counts = np.zeros((len(self.categories) + 1,) + self.shape, dtype=np.int64)
+        self.outside = 0
+
+    def cells(self, lats, lons):
+        """Row and column of the cell of every point; ``-1`` for points outside the grid."""
+        row = np.floor((np.asarray(lats, dtype=float) - self.lat_min) / self.dlat)
+        col = np.floor((np.asarray(lons, dtype=float) - self.lon_min) / self.dlon)
+        with np.errstate(invalid="ignore"):
+            inside = (row >= 0) & (row < self.shape[0]) & (col >= 0) & (col < self.shape[1])
+        return np.where(inside, row, -1).astype(np.int64), np.where(inside, col, -1).astype(np.int64)
+
+    def add(self, lats, lons, offenses):
+        """Count a batch of complaints."""
+        row, col = self.cells(lats, lons)
+        inside = row >= 0
+        self.outside += int((~inside).sum())
+        size = self.shape[0] * self.shape[1]
+        category = pd.Series(offenses).astype(object).map(self.category_codes).fillna(0).to_numpy(dtype=np.int64)
+        counts = np.bincount(category[inside] * size + row[inside] * self.shape[1] + col[inside],
+                             minlength=len(self.counts) * size).reshape(self.counts.shape)
+        self.counts[0] += counts.sum(axis=0)
+        self.counts[1:] += counts[1:]
+
+    @classmethod
+    def from_complaints(cls, path=CRIME_PATH, year=2019, cell_metres=CELL_METRES, categories=CATEGORIES):
+        grid = cls(cell_metres, categories=categories)
+        start, rows = time.perf_counter(), 0
+        for chunk in iter_complaints(path, year, columns=dict(CRIME_COLUMNS, **GEO_COLUMNS)):
+            chunk = chunk[chunk["CMPLNT_NUM"].notna()]
+            grid.add(chunk["Latitude"], chunk["Longitude"], chunk["OFNS_DESC"])
+            rows += len(chunk)
+        log.info("complaint grid: %d complaints (%d outside the grid) in %.1fs", rows, grid.outside,
+                 time.perf_counter() - start)
+        return grid
+
+    def to_frame(self):
+        """Non-empty cells as ``layer``, ``cell`` and ``count`` columns, for the stage cache."""
+        layer, cell = np.nonzero(self.counts.reshape(len(self.counts), -1))
+        flat = self.counts.reshape(len(self.counts), -1)
+        return pd.DataFrame({"layer": layer, "cell": cell, "count": flat[layer, cell]})
+
+    def add_frame(self, frame):
+        """Add the counts of a ``to_frame`` result, e.g. from a grid built on another part of the complaints."""
+        flat = self.counts.reshape(len(self.counts), -1)
+        np.add.at(flat, (frame["layer"].to_numpy(), frame["cell"].to_numpy()), frame["count"].to_numpy())
+
+    @classmethod
+    def from_frame(cls, frame, cell_metres=CELL_METRES, categories=CATEGORIES):
+        grid = cls(cell_metres, categories=categories)
+        grid.add_frame(frame)
+        return grid
+
+    def disc_sums(self, radius_metres):
+        """Complaints of the cells whose centres lie within ``radius_metres`` of each cell's centre, per layer."""
+        layers, rows, cols = self.counts.shape
+        reach = int(radius_metres // self.cell_metres)
+        # Row-wise prefix sums padded with zeros on the left and row totals on the right, so the span of
+        # columns [c - half, c + half] of every cell is the difference of two shifted slices
+        prefix = np.zeros((layers, rows, reach + 1 + cols + reach), dtype=np.int64)
+        np.cumsum(self.counts, axis=2, out=prefix[:, :, reach + 1:reach + 1 + cols])
+        prefix[:, :, reach + 1 + cols:] = prefix[:, :, reach + cols:reach + 1 + cols]
+
+        sums = np.zeros_like(self.counts)
+        for dy in range(-reach, reach + 1):
+            half = int(np.sqrt(max((radius_metres / self.cell_metres) ** 2 - dy ** 2, 0)))
+            spans = (prefix[:, :, reach + 1 + half:reach + 1 + half + cols]
+                     - prefix[:, :, reach - half:reach - half + cols])
+            # The row ``dy`` away contributes its span to every cell of this row
+            if dy >= 0:
+                sums[:, :rows - dy] += spans[:, dy:]
+            else:
+                sums[:, -dy:] += spans[:, :rows + dy]
+        return sums
+
+    def within(self, lats, lons, radius_metres):
+        """Complaints within ``radius_metres`` of every point, one column per layer (NaN outside the grid)."""
+        row, col = self.cells(lats, lons)
+        inside = row >= 0
+        totals = self.disc_sums(radius_metres)[:, row, col].astype(float)
+        totals[:, ~inside] = np.nan
+        names = [density_column(radius_metres)] + [density_column(radius_metres, name) for name in self.categories]
+        return pd.DataFrame(totals.T, columns=names)
+
+
+def crime_density(df, grid, radii=RADII_METRES):
+    """Complaint counts around every listing of ``df`` for each radius, aligned on its index."""
+    frames = [grid.within(df["latitude"], df["longitude"], radius) for radius in radii]
+    return pd.concat(frames, axis=1).set_axis(df.index, axis=0)
+
+
+def main():
+    from airbnb.dataset import load_dataset
+
+    parser = argparse.ArgumentParser(description="Count the complaints around every listing.")
+    parser.add_argument("--path", default=CRIME_PATH)
+    parser.add_argument("--year", type=int, default=2019)
+    parser.add_argument("--radius", type=int, nargs="+", default=RADII_METRES, help="radii in metres")
+    parser.add_argument("--cell", type=int, default=CELL_METRES, help="grid cell size in metres")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    grid = ComplaintGrid.from_complaints(args.path, args.year, args.cell)
+    df = load_dataset()
+    start = time.perf_counter()
+    density = crime_density(df, grid, args.radius)
+    log.info("%d listings x %d radii in %.2fs", len(df), len(args.radius), time.perf_counter() - start)
+    print(density.describe().T.to_string())
+
+
+if __name__ == "__main__":
+    main()
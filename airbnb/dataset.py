@@ -0,0 +1,102 @@
+"""Loading of the listings dataset consumed by the app.
+
+The pipeline writes a typed, compressed Parquet artifact; the CSV produced by
+older notebook runs is still accepted and converted to the same dtypes.
+
+Next to the Parquet file sits an uncompressed Arrow IPC copy that the app
+memory-maps read-only: every session and every server process on a host
+reads the same page-cache pages instead of holding its own decoded frame.
+"""
+import os
+import tempfile
+
+import pandas as pd
+import pyarrow as pa
+
+ARTIFACT_PATH = "data/New_York_Airbnb.parquet"
+CSV_PATH = "data/New_York_Airbnb.csv"
+
+CATEGORICAL_COLUMNS = ["neighbourhood_group", "neighbourhood", "room_type", "host_name"]
+
+# Kept as float64: float32 rounds coordinates to about a metre
+FULL_PRECISION_COLUMNS = ["latitude", "longitude"]
+
+# Parquet row groups carry min/max statistics, so filtered scans skip whole groups
+ROW_GROUP_ROWS = 1 << 17
+
+
+def optimize_dtypes(df):
+    """Categoricals for the text dimensions and the smallest numeric dtypes."""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype("category")
+    for col in df.select_dtypes("integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    for col in df.select_dtypes("floating").columns:
+        if col not in FULL_PRECISION_COLUMNS:
+            df[col] = pd.to_numeric(df[col], downcast="float")
+    return df
+
+
+def mapped_path(path=ARTIFACT_PATH):
+    """The memory-mappable Arrow IPC file derived from the artifact at ``path``."""
+    return os.path.splitext(path)[0] + ".arrow"
+
+
+def write_artifact(df, path=ARTIFACT_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df.to_parquet(path, engine="pyarrow", compression="zstd", index=False, row_group_size=ROW_GROUP_ROWS)
+    write_mapped(df, mapped_path(path))
+
+
+def write_mapped(df, path):
+    """Uncompressed Arrow IPC file of ``df``, replaced atomically.
+
+    Readers that already mapped the previous file keep their pages, so
+    replicas can rebuild it while others are serving.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def map_dataset(path):
+    """Read-only frame backed by the memory-mapped Arrow IPC file at ``path``.
+
+    Numeric columns without nulls are zero-copy views of the mapping (their
+    arrays are not writeable); strings and nullable columns are decoded.
+    """
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def dataset_path(path=ARTIFACT_PATH, csv_path=CSV_PATH):
+    return path if os.path.exists(path) else csv_path
+
+
+def dataset_version(path=ARTIFACT_PATH, csv_path=CSV_PATH):
+    """Cheap identifier of the file ``load_dataset`` reads, for cache keys."""
+    stat = os.stat(dataset_path(path, csv_path))
+    return "%x-%x" % (stat.st_size, stat.st_mtime_ns)
+
+
+def load_dataset(path=ARTIFACT_PATH, csv_path=CSV_PATH):
+    """The listings frame, from the Parquet artifact when it has been built.
+
+    The artifact is served from its memory-mapped Arrow copy, which is
+    (re)written first when missing or older than the Parquet file.
+    """
+    if os.path.exists(path):
+        mapped = mapped_path(path)
+        if not os.path.exists(mapped) or os.stat(mapped).st_mtime_ns < os.stat(path).st_mtime_ns:
+            write_mapped(pd.read_parquet(path, engine="pyarrow"), mapped)
+        return map_dataset(mapped)
+    return optimize_dtypes(pd.read_csv(csv_path))
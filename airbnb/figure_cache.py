@@ -0,0 +1,87 @@
+"""Process-wide cache of Plotly figures shared by every session.
+
+Figures are stored as their JSON serialisation under a key such as
+``(dataset version, chart id, filter parameters)`` and evicted least
+recently used first once the entry count or total size cap is reached.
+"""
+import collections
+import threading
+
+import plotly.io as pio
+
+from airbnb.instrumentation import add_payload
+
+MAX_BYTES = 256 * 2**20
+
+MAX_ENTRIES = 512
+
+
+class FigureCache:
+    """Thread-safe LRU of serialised figures with hit/miss counters."""
+
+    def __init__(self, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """The figure cached under ``key``, calling ``build()`` to create it on a miss.
+
+        The serialised size is reported as the chart's payload to a profiled section.
+        """
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if payload is not None:
+            add_payload(len(payload))
+            return pio.from_json(payload)
+
+        fig = build()
+        payload = fig.to_json()
+        add_payload(len(payload))
+        self._put(key, payload)
+        return fig
+
+    def _put(self, key, payload):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= len(self._entries.pop(key))
+            self._entries[key] = payload
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def entries(self):
+        """``(key, payload)`` pairs from least to most recently used, for a snapshot."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def preload(self, entries):
+        """Insert serialised figures, e.g. a snapshot saved by the warm-up."""
+        for key, payload in entries:
+            self._put(key, payload)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self.bytes,
+                    "hit_rate": self.hits / lookups if lookups else None}
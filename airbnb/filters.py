@@ -0,0 +1,107 @@
+"""Index-backed row selection for the dashboard filters.
+
+Numeric columns keep a sorted copy of their values and the matching row
+order, so a range predicate is two binary searches. Categorical columns keep
+one bitmap per category. A conjunction starts from the most selective range
+and checks the remaining predicates only on those rows.
+"""
+import functools
+
+import numpy as np
+
+RANGE_COLUMNS = ["price", "minimum_nights", "number_of_reviews", "availability_365", "distance_to_nearest_subway"]
+
+CATEGORY_COLUMNS = ["neighbourhood_group"]
+
+
+class FilterIndex:
+    """Answers conjunctive range / equality predicates with row positions.
+
+    Ranges are ``(low, high)`` tuples with inclusive bounds, ``None`` meaning
+    unbounded. Category predicates take one value or a list of values.
+    """
+
+    def __init__(self, df, range_columns=RANGE_COLUMNS, category_columns=CATEGORY_COLUMNS, cache_size=256):
+        self.size = len(df)
+        self.values = {}
+        self.order = {}
+        self.sorted_values = {}
+        for col in range_columns:
+            if col not in df:
+                continue
+            values = df[col].to_numpy()
+            order = np.argsort(values, kind="stable")
+            self.values[col] = values
+            self.order[col] = order
+            self.sorted_values[col] = values[order]
+
+        self.bitmaps = {}
+        for col in category_columns:
+            if col not in df:
+                continue
+            codes, categories = df[col].factorize()
+            self.bitmaps[col] = {category: codes == i for i, category in enumerate(categories)}
+
+        self._cached_select = functools.lru_cache(maxsize=cache_size)(self._select)
+
+    def select(self, **predicates):
+        """Sorted row positions matching every predicate, e.g. for ``df.take``."""
+        key = tuple(sorted((col, tuple(v) if isinstance(v, list) else v) for col, v in predicates.items()))
+        return self._cached_select(key)
+
+    def _bitmap(self, col, value):
+        bitmaps = self.bitmaps[col]
+        if not isinstance(value, tuple):
+            return bitmaps.get(value, np.zeros(self.size, dtype=bool))
+        mask = np.zeros(self.size, dtype=bool)
+        for v in value:
+            if v in bitmaps:
+                mask |= bitmaps[v]
+        return mask
+
+    def _range(self, col, low, high):
+        sorted_values = self.sorted_values[col]
+        start = 0 if low is None else np.searchsorted(sorted_values, low, side="left")
+        stop = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side="right")
+        return start, stop
+
+    def _select(self, key):
+        ranges = []
+        masks = []
+        for col, value in key:
+            if col in self.bitmaps:
+                masks.append(self._bitmap(col, value))
+            elif col in self.sorted_values:
+                low, high = value
+                ranges.append((col, low, high, self._range(col, low, high)))
+            else:
+                raise KeyError("column %r is not indexed" % col)
+
+        if ranges:
+            ranges.sort(key=lambda r: r[3][1] - r[3][0])
+            col, _, _, (start, stop) = ranges[0]
+            rows = self.order[col][start:stop]
+            keep = np.ones(len(rows), dtype=bool)
+            for col, low, high, _ in ranges[1:]:
+                values = self.values[col][rows]
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            for mask in masks:
+                keep &= mask[rows]
+            rows = rows[keep]
+            if len(rows) > self.size // 8:
+                # Wide selections are put back in row order faster through a bitmap than a sort
+                mask = np.zeros(self.size, dtype=bool)
+                mask[rows] = True
+                rows = np.flatnonzero(mask)
+            else:
+                rows = np.sort(rows)
+        elif masks:
+            rows = np.flatnonzero(np.logical_and.reduce(masks))
+        else:
+            rows = np.arange(self.size)
+
+        rows.flags.writeable = False
+        return rows
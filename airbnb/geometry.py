@@ -0,0 +1,210 @@
+"""Neighbourhood polygons for the choropleth maps and the spatial join.
+
+The GeoJSON is parsed once per process and simplified with Douglas-Peucker to
+a tolerance of about one screen pixel at the zoom the maps open at, which
+keeps the shapes visually identical while cutting most of the vertices.
+
+Features are identified by their position in the file, exposed as the
+``polygon_id`` property: neighbourhood names are not unique across boroughs.
+"""
+import functools
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+GEOJSON_PATH = "data/rawData/neighbourhoods.geojson"
+
+CHOROPLETH_ZOOM = 10.5
+
+# Decimal places kept in the simplified coordinates (about one metre)
+PRECISION = 5
+
+
+@functools.lru_cache(maxsize=None)
+def load_neighbourhoods(path=GEOJSON_PATH):
+    """Parsed GeoJSON feature collection. Shared: do not mutate."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def pixel_tolerance(zoom, pixels=1.):
+    """Degrees of longitude covered by ``pixels`` screen pixels at ``zoom``."""
+    return pixels * 360. / (256 * 2 ** zoom)
+
+
+def douglas_peucker(points, tolerance):
+    """Indices of the vertices of ``points`` kept at ``tolerance``."""
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def simplify_ring(ring, tolerance):
+    points = np.asarray(ring, dtype=float)
+    if len(points) <= 4:
+        return np.round(points, PRECISION).tolist()
+    # A closed ring's first and last vertices coincide, so split it at its farthest vertex
+    farthest = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    kept = np.concatenate([douglas_peucker(points[:farthest + 1], tolerance),
+                           farthest + douglas_peucker(points[farthest:], tolerance)[1:]])
+    if len(kept) < 4:
+        kept = np.unique(np.linspace(0, len(points) - 1, 4).astype(int))
+    return np.round(points[kept], PRECISION).tolist()
+
+
+def simplify_geometry(geometry, tolerance):
+    if geometry["type"] == "Polygon":
+        coordinates = [simplify_ring(ring, tolerance) for ring in geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        coordinates = [[simplify_ring(ring, tolerance) for ring in polygon] for polygon in geometry["coordinates"]]
+    else:
+        return geometry
+    return {"type": geometry["type"], "coordinates": coordinates}
+
+
+@functools.lru_cache(maxsize=8)
+def simplified_neighbourhoods(zoom=CHOROPLETH_ZOOM, pixels=1., path=GEOJSON_PATH):
+    """Neighbourhood polygons simplified for display at ``zoom``. Shared: do not mutate."""
+    tolerance = pixel_tolerance(zoom, pixels)
+    geo = load_neighbourhoods(path)
+    return {"type": geo["type"],
+            "features": [{"type": "Feature",
+                          "geometry": simplify_geometry(feature["geometry"], tolerance),
+                          "properties": dict(feature["properties"], polygon_id=i)}
+                         for i, feature in enumerate(geo["features"])]}
+
+
+def with_metrics(geo, metrics, key="neighbourhood"):
+    """Copy of ``geo`` with the columns of ``metrics`` joined into the properties.
+
+    ``metrics`` is a frame with a ``key`` column (``neighbourhood`` or
+    ``polygon_id``); features without a row get ``None`` for each metric.
+    """
+    columns = [col for col in metrics.columns if col != key]
+    records = {row[key]: row for row in metrics.to_dict("records")}
+    features = []
+    for feature in geo["features"]:
+        row = records.get(feature["properties"][key], {})
+        properties = dict(feature["properties"])
+        for col in columns:
+            value = row.get(col)
+            properties[col] = None if value is None or (isinstance(value, float) and math.isnan(value)) else value
+        features.append({"type": "Feature", "geometry": feature["geometry"], "properties": properties})
+    return {"type": geo["type"], "features": features}
+
+
+def polygon_rings(geometry):
+    if geometry["type"] == "Polygon":
+        return [np.asarray(ring, dtype=float) for ring in geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return [np.asarray(ring, dtype=float) for polygon in geometry["coordinates"] for ring in polygon]
+    return []
+
+
+class PolygonIndex:
+    """Point-in-polygon lookup of coordinates against the neighbourhood polygons.
+
+    Points are sorted by longitude once, so each polygon only tests the
+    points inside its bounding box (two binary searches plus a latitude
+    check); those candidates are then tested with the even-odd rule against
+    all of the polygon's edges at once.
+    """
+
+    def __init__(self, geo, block=4096):
+        self.features = geo["features"]
+        self.block = block
+        self.edges = []
+        self.bounds = np.full((len(self.features), 4), np.nan)
+        for i, feature in enumerate(self.features):
+            rings = polygon_rings(feature["geometry"])
+            if not rings:
+                self.edges.append(np.empty((0, 4)))
+                continue
+            self.edges.append(np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings]))
+            vertices = np.concatenate(rings)
+            self.bounds[i] = [*vertices.min(axis=0), *vertices.max(axis=0)]
+
+    def _contains(self, edges, x, y):
+        x1, y1, x2, y2 = (edges[:, i] for i in range(4))
+        inside = np.zeros(len(x), dtype=bool)
+        for start in range(0, len(x), self.block):
+            px = x[start:start + self.block, None]
+            py = y[start:start + self.block, None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+            inside[start:start + self.block] = np.count_nonzero(crosses, axis=1) % 2 == 1
+        return inside
+
+    def locate(self, lats, lons):
+        """Position of the polygon containing each point, ``-1`` when there is none."""
+        x = np.asarray(lons, dtype=float)
+        y = np.asarray(lats, dtype=float)
+        order = np.argsort(x, kind="stable")
+        sorted_x = x[order]
+        result = np.full(len(x), -1, dtype=np.int64)
+
+        for i, (min_x, min_y, max_x, max_y) in enumerate(self.bounds):
+            if np.isnan(min_x):
+                continue
+            start = np.searchsorted(sorted_x, min_x, side="left")
+            stop = np.searchsorted(sorted_x, max_x, side="right")
+            candidates = order[start:stop]
+            candidates = candidates[(y[candidates] >= min_y) & (y[candidates] <= max_y) & (result[candidates] < 0)]
+            if len(candidates):
+                inside = self._contains(self.edges[i], x[candidates], y[candidates])
+                result[candidates[inside]] = i
+        return result
+
+
+def assign_polygons(df, geo, located=None):
+    """Canonical ``polygon_id`` of every listing.
+
+    The polygon containing the listing's coordinates; listings that fall
+    outside every polygon (piers, shorelines) fall back to the polygon with
+    the same borough and neighbourhood name, else ``-1``. ``located`` is the
+    ``PolygonIndex.locate`` result when it was already computed (in parallel).
+    """
+    if located is None:
+        located = PolygonIndex(geo).locate(df["latitude"], df["longitude"])
+    polygon_id = np.array(located, dtype=np.int64)
+
+    by_name = {(f["properties"]["neighbourhood_group"], f["properties"]["neighbourhood"]): i
+               for i, f in reversed(list(enumerate(geo["features"])))}
+    outside = np.flatnonzero(polygon_id < 0)
+    names = zip(df["neighbourhood_group"].to_numpy()[outside], df["neighbourhood"].to_numpy()[outside])
+    polygon_id[outside] = [by_name.get(name, -1) for name in names]
+    return pd.Series(polygon_id, index=df.index, name="polygon_id")
+
+
+def neighbourhood_mismatches(df, polygon_id, geo):
+    """Listings whose ``neighbourhood`` differs from the polygon they were joined to.
+
+    One row per (listed neighbourhood, polygon neighbourhood) pair with the
+    number of listings, most frequent first; unmatched listings have a
+    ``None`` polygon neighbourhood.
+    """
+    polygon_names = np.array([f["properties"]["neighbourhood"] for f in geo["features"]] + [None], dtype=object)
+    joined = pd.DataFrame({"neighbourhood": df["neighbourhood"].astype(object).to_numpy(),
+                           "polygon_neighbourhood": polygon_names[np.asarray(polygon_id)]})
+    mismatched = joined[joined["neighbourhood"] != joined["polygon_neighbourhood"]]
+    return mismatched.value_counts(dropna=False).rename("listings").reset_index()
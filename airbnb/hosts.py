@@ -0,0 +1,119 @@
+"""Host leaderboards keyed on ``host_id``.
+
+Hosts are ranked by total reviews, number of listings or estimated yearly
+revenue. Totals live in one array per metric, indexed by a slot per host, and
+grow as listings are added. Leaderboards come from a partial selection
+(``np.argpartition``) rather than a full sort. The top ``TOP_CACHE`` of each
+metric is kept and refreshed incrementally. Totals only grow when listings
+arrive, so a host outside the cached top can only enter it by being updated:
+the new top is the best of the previous top and the updated hosts.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["reviews", "listings", "revenue"]
+
+# Leaderboard rows kept per metric between updates
+TOP_CACHE = 100
+
+# Revenue estimate (the "San Francisco model"): about half of the stays get a review, a stay lasts at least
+# AVERAGE_STAY nights (or the listing's minimum) and occupancy is capped at MAX_OCCUPANCY of the year
+REVIEW_RATE = 0.5
+AVERAGE_STAY = 3
+MAX_OCCUPANCY = 0.7
+
+
+def estimated_revenue(df):
+    """Estimated yearly revenue of each listing, in dollars."""
+    stay = np.maximum(df["minimum_nights"].to_numpy(dtype=float), AVERAGE_STAY)
+    nights = df["reviews_per_month"].fillna(0).to_numpy(dtype=float) / REVIEW_RATE * stay * 12
+    return df["price"].to_numpy(dtype=float) * np.minimum(nights, MAX_OCCUPANCY * 365)
+
+
+class HostRanking:
+    """Per-host totals of each metric, with top-k leaderboards."""
+
+    def __init__(self, df=None, top_cache=TOP_CACHE):
+        self.top_cache = top_cache
+        self.slots = {}
+        self.host_ids = np.empty(0, dtype=np.int64)
+        self.names = np.empty(0, dtype=object)
+        self.totals = {metric: np.empty(0) for metric in METRICS}
+        self.size = 0
+        self._top = {}
+        if df is not None:
+            self.add(df)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, df):
+        """Add the listings of ``df`` to their hosts' totals."""
+        listings = pd.DataFrame({"host_id": df["host_id"].to_numpy(dtype=np.int64),
+                                 "host_name": df["host_name"].to_numpy(dtype=object),
+                                 "reviews": df["number_of_reviews"].to_numpy(dtype=float),
+                                 "listings": 1.,
+                                 "revenue": estimated_revenue(df)})
+        hosts = listings.groupby("host_id", sort=False).agg(
+            host_name=("host_name", "first"), reviews=("reviews", "sum"),
+            listings=("listings", "sum"), revenue=("revenue", "sum"))
+
+        ids = hosts.index.to_numpy()
+        slots = np.fromiter((self.slots.get(host_id, -1) for host_id in ids), dtype=np.int64, count=len(ids))
+        new = slots < 0
+        slots[new] = self._allocate(ids[new], hosts["host_name"].to_numpy()[new])
+        for metric in METRICS:
+            # Slots are unique after the groupby, so plain fancy-index addition is safe
+            self.totals[metric][slots] += hosts[metric].to_numpy()
+
+        for metric, top in self._top.items():
+            candidates = set(top).union(slots.tolist())
+            self._top[metric] = heapq.nlargest(self.top_cache, candidates, key=self._sort_key(metric))
+
+    def _allocate(self, ids, names):
+        start, end = self.size, self.size + len(ids)
+        if end > len(self.host_ids):
+            capacity = max(end, 2 * len(self.host_ids))
+            self.host_ids = np.resize(self.host_ids, capacity)
+            self.names = np.resize(self.names, capacity)
+            for metric in METRICS:
+                self.totals[metric] = np.resize(self.totals[metric], capacity)
+        self.host_ids[start:end] = ids
+        self.names[start:end] = names
+        for metric in METRICS:
+            self.totals[metric][start:end] = 0.
+        self.slots.update(zip(ids.tolist(), range(start, end)))
+        self.size = end
+        return np.arange(start, end)
+
+    def _sort_key(self, metric):
+        # Higher totals first, ties broken by the smaller host_id
+        totals, host_ids = self.totals[metric], self.host_ids
+        return lambda slot: (totals[slot], -host_ids[slot])
+
+    def _select(self, metric, k):
+        """Slots of the ``k`` best hosts, best first, without sorting the others."""
+        values = self.totals[metric][:self.size]
+        if k < self.size:
+            kth = values[np.argpartition(values, self.size - k)[self.size - k]]
+            # Every host tied with the k-th, so the tie-break decides and not the partition
+            candidates = np.flatnonzero(values >= kth)
+        else:
+            candidates = np.arange(self.size)
+        order = np.lexsort((self.host_ids[candidates], -values[candidates]))
+        return candidates[order[:k]].tolist()
+
+    def top(self, k=10, by="reviews"):
+        """The ``k`` best hosts by ``by``, with all their totals."""
+        if by not in METRICS:
+            raise ValueError("unknown metric %r, expected one of %s" % (by, METRICS))
+        if k > self.top_cache:
+            slots = self._select(by, k)
+        else:
+            if by not in self._top:
+                self._top[by] = self._select(by, self.top_cache)
+            slots = self._top[by][:k]
+        return pd.DataFrame({"host_id": self.host_ids[slots], "host_name": self.names[slots],
+                             **{metric: self.totals[metric][slots] for metric in METRICS}})
@@ -0,0 +1,106 @@
+"""Opt-in profiling of dashboard reruns, per section.
+
+A profiled rerun of a section records its wall time, the CPU time of the
+script thread, the listing rows its computations touched and the bytes it
+emitted to the browser (figure JSON, map HTML, tables). Rows and bytes are
+reported with ``add_rows`` and ``add_payload`` from wherever they happen;
+both are no-ops outside a profiled section, so the hooks can stay in place.
+
+Records are kept in a rolling window per section for percentiles, logged as
+one JSON object per line, and optionally appended to a JSON lines file.
+"""
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["wall_ms", "cpu_ms", "rows", "payload_bytes"]
+
+PERCENTILES = [50, 90, 99]
+
+WINDOW = 500
+
+# Profile every session, and append the records to this file when set
+PROFILE_ENV = "AIRBNB_PROFILE"
+METRICS_PATH_ENV = "AIRBNB_METRICS_PATH"
+
+log = logging.getLogger(__name__)
+
+# Streamlit runs each session's script in its own thread
+_active = threading.local()
+
+
+def add_rows(count):
+    """Count listing rows touched by the section being profiled."""
+    record = getattr(_active, "record", None)
+    if record is not None:
+        record["rows"] += int(count)
+
+
+def add_payload(size):
+    """Count bytes sent to the browser; ``size`` may be a callable, only evaluated when profiling."""
+    record = getattr(_active, "record", None)
+    if record is not None:
+        record["payload_bytes"] += int(size() if callable(size) else size)
+
+
+class SectionProfiler:
+    """Rolling window of the last ``window`` profiled reruns of each section."""
+
+    def __init__(self, window=WINDOW, export_path=None):
+        self.window = window
+        self.export_path = export_path
+        self._records = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(export_path=os.environ.get(METRICS_PATH_ENV))
+
+    @contextlib.contextmanager
+    def measure(self, section, **labels):
+        """Profile the block as one rerun of ``section``; yields the record being filled."""
+        record = dict(labels, section=section, rows=0, payload_bytes=0)
+        outer = getattr(_active, "record", None)
+        _active.record = record
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            record["wall_ms"] = round((time.perf_counter() - wall) * 1000, 2)
+            record["cpu_ms"] = round((time.thread_time() - cpu) * 1000, 2)
+            record["time"] = time.time()
+            _active.record = outer
+            self._add(record)
+
+    def _add(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            self._records[record["section"]].append(record)
+            if self.export_path:
+                with open(self.export_path, "a") as f:
+                    f.write(line + "\n")
+        log.info(line)
+
+    def summary(self):
+        """Per section: the number of reruns in the window and percentiles of each metric."""
+        with self._lock:
+            records = {section: list(window) for section, window in self._records.items()}
+        summary = {}
+        for section, runs in records.items():
+            stats = {"reruns": len(runs)}
+            for metric in METRICS:
+                values = np.array([run[metric] for run in runs], dtype=float)
+                for p in PERCENTILES:
+                    stats["%s_p%d" % (metric, p)] = round(float(np.percentile(values, p)), 2)
+            summary[section] = stats
+        return summary
+
+    def summary_frame(self):
+        return pd.DataFrame.from_dict(self.summary(), orient="index")
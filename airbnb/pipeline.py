@@ -0,0 +1,289 @@
+"""Offline build of the listings dataset used by the app.
+
+Runs the steps that used to live in ``NY_Airbnb.ipynb``: nearest subway
+distance, borough crime totals, complaints within ``--radius`` metres of each
+listing (``airbnb/crime_density.py``), ``reviews_per_month`` fill and column drops,
+plus the spatial join of listings to neighbourhood polygons, then writes the typed Parquet artifact read by ``app.get_data()``.
+
+Stages are cached under ``data/cache`` by the fingerprints of their inputs and
+parameters: an unchanged crime CSV is never re-read, and a new listings file
+only gets subway distances, polygons and complaint counts computed for
+listings that are new or have moved.
+
+The stages form a graph (``airbnb/scheduler.py``): the complaint pass runs
+alongside the listings stages, and the subway distances, polygon join and
+complaint pass are split across ``--workers`` processes (all cores by
+default). The log ends with the stage timeline.
+
+    python -m airbnb.pipeline [--listings ...] [--crime ...] [--year 2019] [--radius 500 ...] [--csv] [--force]
+    python -m airbnb.pipeline --workers 4
+    python -m airbnb.pipeline --listings ... --partition new-york 2019-07
+
+With ``--partition`` the dataset is written to that city and snapshot of the
+partitioned store (``airbnb/store.py``) instead of the single artifact.
+"""
+import argparse
+import contextlib
+import functools
+import logging
+import os
+import time
+
+import pandas as pd
+
+from airbnb.cache import CACHE_DIR, StageCache
+from airbnb.crime import CRIME_COLUMNS, CRIME_PATH, csv_ranges, iter_complaints
+from airbnb.crime_density import CELL_METRES, GEO_COLUMNS, RADII_METRES, ComplaintGrid, crime_density
+from airbnb.dataset import ARTIFACT_PATH, CSV_PATH, load_dataset, optimize_dtypes, write_artifact
+from airbnb.geometry import GEOJSON_PATH, PolygonIndex, assign_polygons, load_neighbourhoods, neighbourhood_mismatches
+from airbnb.scheduler import StageGraph, WorkerPool
+from airbnb.store import partition_path
+from airbnb.subway import SUBWAY_PATH, SubwayIndex
+
+LISTINGS_PATH = "data/rawData/AB_NYC_2019.csv"
+
+DROP_COLUMNS = ["name", "id", "last_review"]
+
+# Bump when a stage's logic changes so its cached outputs are invalidated
+STAGE_VERSIONS = {"subway": 1, "crime": 1, "crime_grid": 1, "polygons": 1, "density": 1, "build": 3}
+
+log = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    """Log the duration of a stage and the status it sets on the yielded dict."""
+    run = {"status": "recomputed"}
+    start = time.perf_counter()
+    yield run
+    log.info("%s: %s in %.2fs", stage, run["status"], time.perf_counter() - start)
+
+
+def read_listings(path=LISTINGS_PATH):
+    return pd.read_csv(path)
+
+
+# Indexes are loaded once per worker process; the fingerprint keys out a file changed since
+@functools.lru_cache(maxsize=4)
+def subway_index(path, fingerprint):
+    return SubwayIndex.from_csv(path)
+
+
+@functools.lru_cache(maxsize=4)
+def polygon_index(path, fingerprint):
+    return PolygonIndex(load_neighbourhoods(path))
+
+
+def nearest_subway(lats, lons, subway_path, fingerprint):
+    return subway_index(subway_path, fingerprint).nearest_distance(lats, lons)
+
+
+def locate_polygons(lats, lons, geojson_path, fingerprint):
+    return polygon_index(geojson_path, fingerprint).locate(lats, lons)
+
+
+def subway_distances(df, subway_path=SUBWAY_PATH, pool=None, fingerprint=None):
+    """Distance in km from every listing to its nearest subway station."""
+    pool = pool or WorkerPool(1)
+    distances = pool.map_rows(nearest_subway, {"lat": df["latitude"], "lon": df["longitude"]}, "float64",
+                              subway_path, fingerprint)
+    return pd.Series(distances, index=df.index)
+
+
+def reuse_rows(df, stage, key, columns, compute, cache, run):
+    """Output columns of every listing, computing ``compute(rows)`` only for new or changed rows.
+
+    The cache holds the ``columns`` of the last listings built under ``key``
+    (their id, coordinates and anything else the output depends on) next to
+    the outputs. ``compute`` returns a frame aligned on the index of the rows
+    it is given.
+    """
+    rows = df[columns]
+    previous = cache.load_frame(stage, key)
+
+    if previous is None:
+        result = rows.join(compute(df))
+    else:
+        result = rows.merge(previous.drop_duplicates("id"), on=columns, how="left", indicator=True)
+        result.index = df.index
+        todo = (result.pop("_merge") == "left_only").to_numpy()
+        if todo.any():
+            computed = compute(df[todo])
+            result.loc[todo, computed.columns] = computed
+        run["status"] = "partial: %d of %d listings recomputed" % (todo.sum(), len(df)) if todo.any() else "skipped"
+
+    cache.save_frame(stage, key, result)
+    return result.drop(columns=columns)
+
+
+def cached_subway_distances(df, subway_path, cache, run, pool):
+    """Subway distances reusing the previous run for listings that have not moved."""
+    fingerprint = cache.file_fingerprint(subway_path)
+    key = cache.key("subway", subway=fingerprint, version=STAGE_VERSIONS["subway"])
+
+    def compute(rows):
+        return subway_distances(rows, subway_path, pool, fingerprint).to_frame("distance_to_nearest_subway")
+
+    distances = reuse_rows(df, "subway", key, ["id", "latitude", "longitude"], compute, cache, run)
+    return distances["distance_to_nearest_subway"]
+
+
+def count_complaints(byte_range, crime_path, year):
+    """Borough totals and complaint grid of one byte range of the complaints CSV."""
+    by_borough = pd.Series(dtype="int64")
+    grid = ComplaintGrid()
+    for chunk in iter_complaints(crime_path, year, columns=dict(CRIME_COLUMNS, **GEO_COLUMNS), byte_range=byte_range):
+        chunk = chunk[chunk["CMPLNT_NUM"].notna()]
+        by_borough = by_borough.add(chunk["BORO_NM"].astype(object).value_counts(), fill_value=0)
+        grid.add(chunk["Latitude"], chunk["Longitude"], chunk["OFNS_DESC"])
+    return by_borough, grid.to_frame()
+
+
+def cached_complaints(crime_path, year, cache, run, pool):
+    """Complaint totals by borough and the complaint grid, from one pass over the CSV split across the pool."""
+    fingerprint = cache.file_fingerprint(crime_path)
+    crime_key = cache.key("crime", crime=fingerprint, year=year, version=STAGE_VERSIONS["crime"])
+    grid_key = cache.key("crime_grid", crime=fingerprint, year=year, cell=CELL_METRES,
+                         version=STAGE_VERSIONS["crime_grid"])
+    cached_crime, cached_grid = cache.load_frame("crime", crime_key), cache.load_frame("crime_grid", grid_key)
+    if cached_crime is not None and cached_grid is not None:
+        run["status"] = "skipped"
+        return cached_crime.set_index("BORO_NM")["crimes"], ComplaintGrid.from_frame(cached_grid)
+
+    ranges = csv_ranges(crime_path, pool.workers)
+    by_borough, grid = pd.Series(dtype="int64"), ComplaintGrid()
+    for part_by_borough, part_grid in pool.map(count_complaints, ranges, crime_path, year):
+        by_borough = by_borough.add(part_by_borough, fill_value=0)
+        grid.add_frame(part_grid)
+    by_borough = by_borough.astype("int64").sort_values(ascending=False).rename_axis("BORO_NM")
+    run["status"] = "%d complaints in %d parts" % (by_borough.sum(), len(ranges))
+
+    cache.save_frame("crime", crime_key, by_borough.rename("crimes").reset_index())
+    cache.save_frame("crime_grid", grid_key, grid.to_frame())
+    return by_borough, grid
+
+
+def polygon_ids(df, geojson_path, cache, run, pool):
+    """Join listings to neighbourhood polygons and log the name mismatches.
+
+    Reuses the previous run's polygon for listings whose coordinates and
+    neighbourhood (the fallback outside every polygon) have not changed.
+    """
+    fingerprint = cache.file_fingerprint(geojson_path)
+    key = cache.key("polygons", geojson=fingerprint, version=STAGE_VERSIONS["polygons"])
+    geo = load_neighbourhoods(geojson_path)
+
+    def compute(rows):
+        located = pool.map_rows(locate_polygons, {"lat": rows["latitude"], "lon": rows["longitude"]}, "int64",
+                                geojson_path, fingerprint)
+        return assign_polygons(rows, geo, located).to_frame()
+
+    columns = ["id", "latitude", "longitude", "neighbourhood_group", "neighbourhood"]
+    polygon_id = reuse_rows(df, "polygons", key, columns, compute, cache, run)["polygon_id"].astype("int64")
+    mismatches = neighbourhood_mismatches(df, polygon_id, geo)
+
+    summary = "%d listings outside every polygon, %d with a different neighbourhood name" % (
+        (polygon_id < 0).sum(), mismatches["listings"].sum())
+    run["status"] = summary if run["status"] == "recomputed" else "%s; %s" % (run["status"], summary)
+    for row in mismatches.head(10).itertuples():
+        log.info("  %s -> %s: %d listings", row.neighbourhood, row.polygon_neighbourhood, row.listings)
+    return polygon_id
+
+
+def cached_crime_density(df, grid, crime_path, year, radii, cache, run):
+    """Complaint counts around every listing, reusing the previous run for listings that have not moved."""
+    key = cache.key("density", crime=cache.file_fingerprint(crime_path), year=year, cell=CELL_METRES,
+                    radii=sorted(radii), version=STAGE_VERSIONS["density"])
+    return reuse_rows(df, "density", key, ["id", "latitude", "longitude"],
+                      lambda rows: crime_density(rows, grid, radii), cache, run)
+
+
+def add_crimes(df, by_borough):
+    """Borough-wide complaint total on every listing."""
+    return df.assign(crimes=df["neighbourhood_group"].str.upper().map(by_borough))
+
+
+def clean(df):
+    df = df.drop(columns=DROP_COLUMNS, errors="ignore")
+    return df.assign(reviews_per_month=df["reviews_per_month"].fillna(df["reviews_per_month"].mean()))
+
+
+def join(df, distances, polygon_id, density, by_borough):
+    df = df.assign(distance_to_nearest_subway=distances, polygon_id=polygon_id).join(density)
+    return optimize_dtypes(clean(add_crimes(df, by_borough)))
+
+
+def build_graph(listings_path, subway_path, crime_path, year, output, csv_output, cache, geojson_path, radii, pool):
+    """The build as a stage graph; ``run()`` returns the dataset as the ``write`` result."""
+    def write(run, df):
+        write_artifact(df, output)
+        if csv_output:
+            df.to_csv(csv_output, index=False)
+        return df
+
+    graph = StageGraph()
+    graph.add("listings", lambda run: read_listings(listings_path))
+    graph.add("complaints", lambda run: cached_complaints(crime_path, year, cache, run, pool))
+    graph.add("subway", lambda run, df: cached_subway_distances(df, subway_path, cache, run, pool), after=["listings"])
+    graph.add("neighbourhoods", lambda run, df: polygon_ids(df, geojson_path, cache, run, pool), after=["listings"])
+    graph.add("crime density", lambda run, df, complaints:
+              cached_crime_density(df, complaints[1], crime_path, year, radii, cache, run),
+              after=["listings", "complaints"])
+    graph.add("join", lambda run, df, distances, polygon_id, density, complaints:
+              join(df, distances, polygon_id, density, complaints[0]),
+              after=["listings", "subway", "neighbourhoods", "crime density", "complaints"])
+    graph.add("write", write, after=["join"])
+    return graph
+
+
+def build(listings_path=LISTINGS_PATH, subway_path=SUBWAY_PATH, crime_path=CRIME_PATH, year=2019,
+          output=ARTIFACT_PATH, csv_output=None, cache_dir=CACHE_DIR, force=False, geojson_path=GEOJSON_PATH,
+          radii=RADII_METRES, workers=None):
+    cache = StageCache(cache_dir)
+
+    with timed("fingerprint") as run:
+        build_key = cache.key("build", listings=cache.file_fingerprint(listings_path),
+                              subway=cache.file_fingerprint(subway_path), crime=cache.file_fingerprint(crime_path),
+                              geojson=cache.file_fingerprint(geojson_path), year=year, radii=sorted(radii),
+                              output=output, csv_output=csv_output, version=STAGE_VERSIONS["build"])
+        up_to_date = not force and cache.has("build", build_key) and os.path.exists(output)
+        run["status"] = "build up to date" if up_to_date else "inputs changed"
+    if up_to_date:
+        return load_dataset(output)
+
+    with WorkerPool(workers) as pool:
+        graph = build_graph(listings_path, subway_path, crime_path, year, output, csv_output, cache, geojson_path,
+                            radii, pool)
+        df = graph.run()["write"]
+    log.info("%d workers, stage timeline:\n%s", pool.workers, graph.report())
+
+    cache.mark("build", build_key)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the listings artifact used by the app.")
+    parser.add_argument("--listings", default=LISTINGS_PATH)
+    parser.add_argument("--subway", default=SUBWAY_PATH)
+    parser.add_argument("--crime", default=CRIME_PATH)
+    parser.add_argument("--geojson", default=GEOJSON_PATH)
+    parser.add_argument("--year", type=int, default=2019)
+    parser.add_argument("--radius", type=int, nargs="+", default=RADII_METRES,
+                        help="count the complaints within these radii (metres) of each listing")
+    parser.add_argument("--output", default=ARTIFACT_PATH)
+    parser.add_argument("--partition", nargs=2, metavar=("CITY", "SNAPSHOT"),
+                        help="write to this partition of the store instead of --output")
+    parser.add_argument("--csv", action="store_true", help="also write %s" % CSV_PATH)
+    parser.add_argument("--workers", type=int, help="processes for the partitioned stages (default: all cores)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--force", action="store_true", help="rebuild even if the inputs are unchanged")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    output = partition_path(*args.partition) if args.partition else args.output
+    build(args.listings, args.subway, args.crime, args.year, output, CSV_PATH if args.csv else None,
+          args.cache_dir, args.force, args.geojson, args.radius, args.workers)
+
+
+if __name__ == "__main__":
+    main()
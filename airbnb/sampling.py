@@ -0,0 +1,57 @@
+"""Density-preserving decimation of listings for point-per-row charts.
+
+Above a point budget, rows are sampled in proportion to the size of each
+borough x room type stratum, so the relative density of the chart is kept,
+after first reserving the outliers of each stratum (beyond its 1st / 99th
+percentiles) so that the extremes a reader looks for are never dropped.
+"""
+import numpy as np
+
+STRATA = ["neighbourhood_group", "room_type"]
+
+OUTLIER_QUANTILES = (.01, .99)
+
+
+def decimate(df, budget, value_columns, strata=STRATA, outlier_quantiles=OUTLIER_QUANTILES, seed=0):
+    """At most about ``budget`` rows of ``df``, in their original order.
+
+    Per-stratum outliers of ``value_columns`` are kept first (up to half the
+    budget, or all of it when every row is an outlier); the rest of the budget
+    is split across strata proportionally to their remaining rows and filled at
+    random within each stratum.
+    """
+    if len(df) <= budget:
+        return df
+    rng = np.random.default_rng(seed)
+    strata = [col for col in strata if col in df]
+    groups = df.groupby(strata, observed=True, sort=False) if strata else None
+
+    outliers = np.zeros(len(df), dtype=bool)
+    for col in value_columns:
+        values = df[col]
+        if groups is None:
+            low, high = values.quantile(outlier_quantiles[0]), values.quantile(outlier_quantiles[1])
+        else:
+            low = groups[col].transform("quantile", outlier_quantiles[0])
+            high = groups[col].transform("quantile", outlier_quantiles[1])
+        outliers |= ((values < low) | (values > high)).to_numpy()
+
+    outlier_rows, rest = np.flatnonzero(outliers), np.flatnonzero(~outliers)
+    cap = budget // 2 if len(rest) else budget
+    if len(outlier_rows) > cap:
+        outlier_rows = np.sort(rng.choice(outlier_rows, cap, replace=False))
+    if len(rest) == 0:
+        return df.iloc[outlier_rows]
+
+    fraction = (budget - len(outlier_rows)) / len(rest)
+    if strata:
+        # Random rank within each stratum; a stratum keeps its proportional quota of the lowest ranks
+        rest_groups = df.iloc[rest][strata].assign(_key=rng.random(len(rest))).groupby(strata, observed=True,
+                                                                                        sort=False)["_key"]
+        rank = rest_groups.rank(method="first").to_numpy()
+        quota = np.round(rest_groups.transform("size").to_numpy() * fraction)
+        sampled = rest[rank <= quota]
+    else:
+        sampled = np.sort(rng.choice(rest, min(budget - len(outlier_rows), len(rest)), replace=False))
+
+    return df.iloc[np.union1d(outlier_rows, sampled)]
@@ -0,0 +1,178 @@
+"""DAG scheduling of pipeline stages, and row-partitioned work on a process pool.
+
+``StageGraph`` starts every stage as soon as the stages it reads from have
+finished, each on its own thread, so independent stages (the complaint pass,
+subway distances, the polygon join) overlap. The heavy work inside a stage
+fans out to a ``WorkerPool``. ``map_rows`` copies the input columns once into
+shared memory. Each worker process maps them, computes its slice of rows and
+writes it into a shared output array, so neither the inputs nor the results
+are pickled per task.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Below this many rows per worker, map_rows runs in the calling process
+MIN_PARTITION_ROWS = 10_000
+
+log = logging.getLogger(__name__)
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+
+class SharedArrays:
+    """Copies of numpy arrays in shared memory, described by picklable ``handles``."""
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.arrays = {}
+        self.handles = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks.append(block)
+            self.arrays[name] = np.ndarray(array.shape, array.dtype, buffer=block.buf)
+            self.arrays[name][...] = array
+            self.handles[name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The views must go before their blocks can be closed
+        self.arrays = {}
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def _map_partition(func, handles, start, stop, args):
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in handles.items():
+        blocks.append(shared_memory.SharedMemory(name=block_name))
+        arrays[name] = np.ndarray(shape, dtype, buffer=blocks[-1].buf)
+    try:
+        output = arrays.pop("output")
+        output[start:stop] = func(*(array[start:stop] for array in arrays.values()), *args)
+    finally:
+        arrays.clear()
+        output = None
+        for block in blocks:
+            block.close()
+
+
+class WorkerPool:
+    """A process pool of ``workers`` processes; with one worker, everything runs in the calling process.
+
+    Workers are started from a fork server where there is one: the stages
+    submitting tasks run on threads, and forking a process with running
+    threads can copy locks held by them.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or available_cores()
+        self.executor = None
+        if self.workers > 1:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=context)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def map(self, func, items, *args):
+        """``[func(item, *args) for item in items]``, one task per item."""
+        if self.executor is None:
+            return [func(item, *args) for item in items]
+        return list(self.executor.map(func, items, *([arg] * len(items) for arg in args)))
+
+    def map_rows(self, func, columns, dtype, *args):
+        """``func(*columns, *args)`` computed over row partitions, one per worker.
+
+        ``columns`` maps names to equal-length arrays; ``func`` must be a
+        module-level function returning one ``dtype`` value per row.
+        """
+        rows = len(next(iter(columns.values())))
+        parts = min(self.workers, rows // MIN_PARTITION_ROWS)
+        if self.executor is None or parts < 2:
+            return np.asarray(func(*(np.asarray(column) for column in columns.values()), *args), dtype=dtype)
+
+        bounds = np.linspace(0, rows, parts + 1).astype(int)
+        arrays = {name: np.asarray(column) for name, column in columns.items()}
+        with SharedArrays(dict(arrays, output=np.empty(rows, dtype=dtype))) as shared:
+            futures = [self.executor.submit(_map_partition, func, shared.handles, start, stop, args)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+            return shared.arrays["output"].copy()
+
+
+class StageGraph:
+    """Named stages, each run once the stages listed in its ``after`` have finished."""
+
+    def __init__(self):
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, func, after=()):
+        """Add a stage computing ``func(run, *results of after)``; ``run["status"]`` is logged with its time."""
+        unknown = [stage for stage in after if stage not in self.stages]
+        if unknown:
+            raise ValueError("stage %r runs after unknown stages %s" % (name, unknown))
+        # Stages can only depend on stages added before them, so the graph has no cycles
+        self.stages[name] = (func, list(after))
+
+    def _run_stage(self, name, func, inputs, origin):
+        run = {"status": "recomputed"}
+        start = time.perf_counter()
+        result = func(run, *inputs)
+        end = time.perf_counter()
+        self.timings[name] = (start - origin, end - origin)
+        log.info("%s: %s in %.2fs", name, run["status"], end - start)
+        return result
+
+    def run(self):
+        """Run every stage and return their results by name."""
+        results, running = {}, {}
+        pending = dict(self.stages)
+        origin = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max(len(self.stages), 1)) as executor:
+            while pending or running:
+                for name, (func, after) in list(pending.items()):
+                    if all(stage in results for stage in after):
+                        del pending[name]
+                        future = executor.submit(self._run_stage, name, func, [results[s] for s in after], origin)
+                        running[future] = name
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+        return results
+
+    def report(self):
+        """Start, end and duration of every stage, in start order, and the overlap they achieved."""
+        lines = ["%-16s %8s %8s %8s" % ("stage", "start", "end", "seconds")]
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1]):
+            lines.append("%-16s %8.2f %8.2f %8.2f" % (name, start, end, end - start))
+        if self.timings:
+            wall = max(end for _, end in self.timings.values())
+            busy = sum(end - start for start, end in self.timings.values())
+            lines.append("wall %.2fs for %.2fs of stages (%.2fx overlap)" % (wall, busy, busy / wall if wall else 1))
+        return "\n".join(lines)
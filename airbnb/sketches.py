@@ -0,0 +1,227 @@
+"""Mergeable quantile sketches per listing cell.
+
+For every cell (by default borough x neighbourhood x room type) and measure,
+values are counted in logarithmic buckets, as in DDSketch: bucket ``k`` holds
+the values in ``(gamma**(k-1), gamma**k]`` with ``gamma = (1+alpha)/(1-alpha)``,
+and zeros have a bucket of their own. Sketches of any set of cells merge by
+adding their counts, so the percentile table or box plot of a selection costs
+a sum over a few hundred buckets instead of a sort of its rows.
+
+Error bounds, for any merge of cells: each quantile is within ``alpha``
+(relative) of the value ``Series.quantile`` returns, linear interpolation
+included. Zeros, and integers alone in their bucket (integer measures below
+``1 / (2 * alpha)``), are exact. Count, sum, mean, standard deviation, min
+and max are exact. Measures must not be negative.
+
+``exact=True`` keeps the rows instead and answers the same calls exactly, to
+check the sketches against (``python -m airbnb.sketches`` reports the largest
+error observed on the built dataset). The app switches to it when
+``AIRBNB_EXACT_QUANTILES`` is set.
+"""
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+ALPHA = 0.01
+
+EXACT_ENV = "AIRBNB_EXACT_QUANTILES"
+
+
+def percentile_label(q):
+    """Column name ``describe()`` gives a percentile, e.g. ``"25%"``."""
+    return "%g%%" % (q * 100)
+
+
+class MeasureSketch:
+    """Bucket counts and exact moments of one measure in every cell."""
+
+    def __init__(self, values, cells, n_cells, gamma, integer=False):
+        valid = ~np.isnan(values)
+        values, cells = values[valid], cells[valid]
+        if (values < 0).any():
+            raise ValueError("quantile sketches need non-negative values")
+
+        positive = values > 0
+        keys = np.ceil(np.log(values[positive]) / np.log(gamma)).astype(np.int64)
+        self.offset = keys.min() if len(keys) else 0
+        n_buckets = (keys.max() - self.offset + 1) if len(keys) else 1
+        # Float counts (exact below 2**53) so merges are one matrix product
+        self.counts = np.bincount(cells[positive] * n_buckets + keys - self.offset,
+                                  minlength=n_cells * n_buckets).reshape(n_cells, n_buckets).astype(float)
+        self.moments = np.column_stack([np.bincount(cells, minlength=n_cells),
+                                        np.bincount(cells[~positive], minlength=n_cells),
+                                        np.bincount(cells, weights=values, minlength=n_cells),
+                                        np.bincount(cells, weights=values * values, minlength=n_cells)])
+        self.minimum = np.full(n_cells, np.inf)
+        self.maximum = np.full(n_cells, -np.inf)
+        np.minimum.at(self.minimum, cells, values)
+        np.maximum.at(self.maximum, cells, values)
+
+        # A bucket's value: the point within alpha of both edges, or for integer measures the only integer it holds
+        upper = gamma ** np.arange(self.offset, self.offset + n_buckets, dtype=float)
+        self.values = 2 * upper / (gamma + 1)
+        if integer:
+            lower, whole = upper / gamma, np.floor(upper)
+            self.values = np.where((whole > lower) & (whole - 1 <= lower), whole, self.values)
+
+    def merge(self, membership, order, starts):
+        """Per group: counts, zeros, n, sum, sum of squares, min and max.
+
+        ``membership`` is the groups x cells indicator matrix; ``order`` lists
+        the member cells group after group, each group starting at ``starts``.
+        """
+        counts = membership @ self.counts
+        n, zeros, total, total_sq = (membership @ self.moments).T
+        return (counts, zeros, n, total, total_sq,
+                np.minimum.reduceat(self.minimum[order], starts), np.maximum.reduceat(self.maximum[order], starts))
+
+    def at_most(self, counts, zeros, maximum, limit):
+        """Merged counts, n, sum, sum of squares and max of the values up to ``limit``, from the bucket values."""
+        counts = counts * (self.values <= limit)
+        occupied = counts > 0
+        top = self.values[counts.shape[1] - 1 - np.argmax(occupied[:, ::-1], axis=1)]
+        maximum = np.where(occupied.any(axis=1), np.minimum(top, maximum), 0.)
+        return counts, zeros + counts.sum(axis=1), counts @ self.values, counts @ self.values ** 2, maximum
+
+    def quantiles(self, counts, zeros, n, minimum, maximum, qs):
+        """``Series.quantile`` of each merged group, linear interpolation between the estimated order statistics."""
+        cumulative = np.cumsum(counts, axis=1) + zeros[:, None]
+
+        def value_at(rank):
+            bucket = np.minimum((cumulative <= rank[:, None]).sum(axis=1), counts.shape[1] - 1)
+            value = np.where(rank < zeros, 0., self.values[bucket])
+            return np.clip(value, minimum, maximum)
+
+        result = np.full((len(n), len(qs)), np.nan)
+        for j, q in enumerate(qs):
+            h = q * np.maximum(n - 1, 0)
+            below = value_at(np.floor(h))
+            result[:, j] = below + (h - np.floor(h)) * (value_at(np.ceil(h)) - below)
+        result[n == 0] = np.nan
+        return result
+
+
+class CellSketches:
+    """Quantile sketches of each measure for every cell of ``dimensions``."""
+
+    def __init__(self, df, dimensions, measures, alpha=ALPHA, exact=False):
+        self.dimensions = list(dimensions)
+        self.measures = [m for m in measures if m in df]
+        self.alpha = alpha
+        self.exact = exact
+
+        grouped = df.groupby(self.dimensions, observed=True, sort=True)
+        cell = grouped.ngroup().to_numpy()
+        self.cells = grouped.size().reset_index()[self.dimensions]
+        # Integer codes of each cell's dimension values, so selections and groupings stay in numpy
+        self.levels, self.codes = {}, {}
+        for dim in self.dimensions:
+            self.codes[dim], self.levels[dim] = pd.factorize(self.cells[dim], sort=True)
+        if exact:
+            self.rows = df[self.dimensions + self.measures]
+            self.row_cells = cell
+            return
+
+        gamma = (1 + alpha) / (1 - alpha)
+        known = cell >= 0
+        self.sketches = {m: MeasureSketch(df[m].to_numpy(dtype=float)[known], cell[known], len(self.cells), gamma,
+                                          integer=df[m].dtype.kind in "iu")
+                         for m in self.measures}
+
+    def _select(self, selection):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dim, value in selection.items():
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            wanted = pd.Index(self.levels[dim]).get_indexer(values)
+            mask &= np.isin(self.codes[dim], wanted[wanted >= 0])
+        return np.flatnonzero(mask)
+
+    def describe(self, measure, by=(), percentiles=(.25, .5, .75), at_most=None, **selection):
+        """``groupby(by)[measure].describe(percentiles)`` of the selected cells, with ``by`` as columns.
+
+        ``selection`` maps dimensions to a value or a list of values. With
+        ``at_most``, only values up to it are described; the moments then come
+        from the bucket values too, so they are exact only when every kept
+        bucket holds a single integer.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        selected = self._select(selection)
+        columns = ["count", "mean", "std", "min"] + [percentile_label(q) for q in percentiles] + ["max"]
+        if self.exact:
+            return self._describe_rows(measure, by, percentiles, at_most, selected, columns)
+        if not len(selected):
+            return pd.DataFrame(columns=by + columns)
+
+        key = np.zeros(len(selected), dtype=np.int64)
+        for dim in by:
+            key = key * len(self.levels[dim]) + self.codes[dim][selected]
+        _, first, group = np.unique(key, return_index=True, return_inverse=True)
+        order = np.argsort(group, kind="stable")
+        starts = np.searchsorted(group[order], np.arange(len(first)))
+
+        membership = np.zeros((len(first), len(self.cells)))
+        membership[group, selected] = 1.
+        sketch = self.sketches[measure]
+        counts, zeros, n, total, total_sq, minimum, maximum = sketch.merge(membership, selected[order], starts)
+        if at_most is not None:
+            counts, n, total, total_sq, maximum = sketch.at_most(counts, zeros, maximum, at_most)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / n
+            std = np.sqrt(np.maximum(total_sq - total * mean, 0) / (n - 1))
+        stats = np.column_stack([n, mean, std, minimum,
+                                 sketch.quantiles(counts, zeros, n, minimum, maximum, percentiles), maximum])
+        stats[n == 0, 1:] = np.nan
+        frame = pd.DataFrame(stats, columns=columns)
+        for i, dim in enumerate(by):
+            frame.insert(i, dim, self.cells[dim].take(selected[first]).reset_index(drop=True))
+        return frame
+
+    def _describe_rows(self, measure, by, percentiles, at_most, selected, columns):
+        rows = self.rows if len(selected) == len(self.cells) else self.rows[np.isin(self.row_cells, selected)]
+        if at_most is not None:
+            rows = rows[rows[measure] <= at_most]
+        if not by:
+            return rows[measure].describe(percentiles=list(percentiles)).to_frame().T.reset_index(drop=True)[columns]
+        grouped = rows.groupby(by, observed=True)[measure]
+        quantiles = grouped.quantile(list(percentiles)).unstack().rename(columns=percentile_label)
+        stats = [grouped.agg(["count", "mean", "std", "min"]), quantiles, grouped.max().rename("max")]
+        return pd.concat(stats, axis=1).reset_index()[by + columns]
+
+
+def max_errors(df, dimensions, measures, percentiles, alpha=ALPHA):
+    """Largest relative error of the sketched quantiles per measure, over every grouping of ``dimensions``."""
+    sketched = CellSketches(df, dimensions, measures, alpha)
+    exact = CellSketches(df, dimensions, measures, alpha, exact=True)
+    labels = [percentile_label(q) for q in percentiles]
+    errors = {}
+    for measure in sketched.measures:
+        worst = 0.
+        for size in range(len(dimensions) + 1):
+            for by in itertools.combinations(dimensions, size):
+                estimate = sketched.describe(measure, by, percentiles)[labels].to_numpy(dtype=float)
+                truth = exact.describe(measure, by, percentiles)[labels].to_numpy(dtype=float)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    error = np.abs(estimate - truth) / np.abs(truth)
+                error[truth == 0] = np.abs(estimate[truth == 0])
+                worst = max(worst, np.nanmax(error))
+        errors[measure] = worst
+    return errors
+
+
+def main():
+    # Imported here: the aggregate cube builds its rollups from this module
+    from airbnb.aggregates import DIMENSIONS, MEASURES, QUANTILES
+    from airbnb.dataset import load_dataset
+
+    parser = argparse.ArgumentParser(description="Compare the quantile sketches with exact quantiles.")
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    args = parser.parse_args()
+
+    for measure, error in max_errors(load_dataset(), DIMENSIONS, MEASURES, QUANTILES, args.alpha).items():
+        print("%-28s max relative error %.5f (bound %g)" % (measure, error, args.alpha))
+
+
+if __name__ == "__main__":
+    main()
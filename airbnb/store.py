@@ -0,0 +1,97 @@
+"""Partitioned storage of listings from several cities and snapshots.
+
+    data/listings/city=<city>/snapshot=<snapshot>/listings.parquet
+
+Each partition is a dataset artifact as written by ``write_artifact`` (the
+typed Parquet file and its memory-mappable Arrow copy), so the app maps one
+partition at a time. ``scan`` reads across partitions for comparisons: it only
+opens the partitions asked for, and pushes the column selection and row
+filter down to Parquet, which skips the columns and, by their min/max
+statistics, the row groups a query does not need.
+
+    python -m airbnb.store
+"""
+import argparse
+import glob
+import os
+import re
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from airbnb.dataset import dataset_version, write_artifact
+
+STORE_PATH = "data/listings"
+
+PARTITION_FILE = "listings.parquet"
+
+PARTITION_COLUMNS = ["city", "snapshot"]
+
+# Partition names appear in paths and in dataset versions, which are split on dots
+NAME = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def partition_path(city, snapshot, root=STORE_PATH):
+    for name in (city, snapshot):
+        if not NAME.match(name):
+            raise ValueError("invalid partition name %r: use lowercase letters, digits, '-' and '_'" % name)
+    return os.path.join(root, "city=" + city, "snapshot=" + snapshot, PARTITION_FILE)
+
+
+def partitions(root=STORE_PATH):
+    """``(city, snapshot)`` of every stored partition, sorted."""
+    found = []
+    for path in glob.glob(os.path.join(root, "city=*", "snapshot=*", PARTITION_FILE)):
+        snapshot_dir = os.path.dirname(path)
+        city = os.path.basename(os.path.dirname(snapshot_dir))[len("city="):]
+        found.append((city, os.path.basename(snapshot_dir)[len("snapshot="):]))
+    return sorted(found)
+
+
+def partition_version(city, snapshot, root=STORE_PATH):
+    """``dataset_version`` of a partition, prefixed with its name so partitions never share cache keys."""
+    return "%s.%s.%s" % (city, snapshot, dataset_version(partition_path(city, snapshot, root)))
+
+
+def version_partition(version):
+    """``(city, snapshot)`` of a ``partition_version``, ``None`` for the single-file dataset."""
+    parts = version.split(".")
+    return (parts[0], parts[1]) if len(parts) == 3 else None
+
+
+def write_partition(df, city, snapshot, root=STORE_PATH):
+    path = partition_path(city, snapshot, root)
+    write_artifact(df, path)
+    return path
+
+
+def scan(columns=None, filter=None, cities=None, snapshots=None, root=STORE_PATH):
+    """Rows of the selected partitions matching ``filter``, with ``city`` and ``snapshot`` columns.
+
+    ``columns`` limits the listing columns read; ``filter`` is a
+    ``pyarrow.dataset`` expression such as ``ds.field("price") < 100``.
+    """
+    files = [partition_path(city, snapshot, root) for city, snapshot in partitions(root)
+             if (cities is None or city in cities) and (snapshots is None or snapshot in snapshots)]
+    if columns is not None:
+        columns = PARTITION_COLUMNS + [col for col in columns if col not in PARTITION_COLUMNS]
+    if not files:
+        return pd.DataFrame(columns=columns or PARTITION_COLUMNS)
+
+    dataset = ds.dataset(files, format="parquet", partitioning="hive", partition_base_dir=root)
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the stored listing partitions.")
+    parser.add_argument("--root", default=STORE_PATH)
+    args = parser.parse_args()
+
+    for city, snapshot in partitions(args.root):
+        path = partition_path(city, snapshot, args.root)
+        rows = ds.dataset(path, format="parquet").count_rows()
+        print("%-20s %-12s %10d rows  %s" % (city, snapshot, rows, path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Nearest subway station lookups over a KD-tree.
+
+Stations are projected onto the unit sphere so that the euclidean (chord)
+distance returned by the tree is monotonic in the great-circle distance, which
+is recovered exactly with ``2 * R * arcsin(chord / 2)``.
+"""
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+SUBWAY_PATH = "data/rawData/nyc-transit-subway-entrance-and-exit-data.csv"
+
+ROUTE_COLUMNS = ["Route%d" % i for i in range(1, 12)]
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between points given in degrees."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0., 1.)))
+
+
+def to_unit_sphere(lats, lons):
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    cos_lat = np.cos(lats)
+    return np.column_stack([cos_lat * np.cos(lons), cos_lat * np.sin(lons), np.sin(lats)])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0., 1.))
+
+
+def km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+def load_stations(path=SUBWAY_PATH):
+    """One row per station with its name, served lines and coordinates.
+
+    The raw file has one row per entrance, so stations are deduplicated on
+    name and location and their routes merged into a single ``lines`` string.
+    """
+    df_subway = pd.read_csv(path, usecols=["Station Name", "Station Latitude", "Station Longitude"] + ROUTE_COLUMNS,
+                            dtype={col: str for col in ROUTE_COLUMNS})
+    df_subway = df_subway.rename(columns={"Station Name": "station",
+                                          "Station Latitude": "latitude",
+                                          "Station Longitude": "longitude"})
+
+    routes = df_subway.melt(id_vars=["station", "latitude", "longitude"], value_vars=ROUTE_COLUMNS, value_name="route")
+    routes = routes.dropna(subset=["route"])
+    lines = routes.groupby(["station", "latitude", "longitude"])["route"]\
+        .agg(lambda x: " ".join(sorted(set(x.str.strip()))))
+
+    stations = df_subway[["station", "latitude", "longitude"]].drop_duplicates()
+    stations = stations.merge(lines.rename("lines").reset_index(), on=["station", "latitude", "longitude"], how="left")
+    stations["lines"] = stations["lines"].fillna("")
+    return stations.reset_index(drop=True)
+
+
+class SubwayIndex:
+    """Spatial index answering batched nearest and radius queries."""
+
+    def __init__(self, stations):
+        self.stations = stations.reset_index(drop=True)
+        self.tree = cKDTree(to_unit_sphere(self.stations["latitude"], self.stations["longitude"]))
+
+    @classmethod
+    def from_csv(cls, path=SUBWAY_PATH):
+        return cls(load_stations(path))
+
+    def nearest_distance(self, lats, lons):
+        """Distance in km to the closest station for every point."""
+        chord, _ = self.tree.query(to_unit_sphere(lats, lons), k=1)
+        return chord_to_km(chord)
+
+    def query(self, lats, lons, k=1):
+        """The ``k`` closest stations to every point, nearest first.
+
+        Returns a long frame with one row per (point, rank) holding the point
+        position, the station name, its lines and the distance in km.
+        """
+        points = to_unit_sphere(lats, lons)
+        chord, idx = self.tree.query(points, k=k)
+        chord = np.asarray(chord).reshape(len(points), -1)
+        idx = np.asarray(idx).reshape(len(points), -1)
+
+        result = pd.DataFrame({
+            "point": np.repeat(np.arange(len(points)), idx.shape[1]),
+            "rank": np.tile(np.arange(1, idx.shape[1] + 1), len(points)),
+            "distance_km": chord_to_km(chord.ravel()),
+        })
+        stations = self.stations.iloc[idx.ravel()]
+        result["station"] = stations["station"].to_numpy()
+        result["lines"] = stations["lines"].to_numpy()
+        return result
+
+    def query_radius(self, lats, lons, radius_km):
+        """Every station within ``radius_km`` of each point, nearest first."""
+        points = to_unit_sphere(lats, lons)
+        neighbours = self.tree.query_ball_point(points, r=km_to_chord(radius_km))
+
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+        point = np.repeat(np.arange(len(points)), counts)
+        idx = np.fromiter((i for n in neighbours for i in n), dtype=np.int64, count=counts.sum())
+
+        chord = np.linalg.norm(points[point] - self.tree.data[idx], axis=1)
+        result = pd.DataFrame({"point": point, "distance_km": chord_to_km(chord)})
+        stations = self.stations.iloc[idx]
+        result["station"] = stations["station"].to_numpy()
+        result["lines"] = stations["lines"].to_numpy()
+        return result.sort_values(["point", "distance_km"], kind="stable").reset_index(drop=True)
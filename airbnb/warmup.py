@@ -0,0 +1,165 @@
+"""Warm-up run before the app server accepts traffic.
+
+    python -m airbnb.warmup [--measure]
+
+``setup.sh`` runs it on container start. It imports the heavy modules the
+app loads lazily, which compiles their bytecode and pulls them into the page
+cache. It then maps each dataset the app serves (every partition of the store,
+else the single-file dataset), writing the Arrow copy if needed, and renders
+every dashboard section headless with its default widget values. The
+resulting aggregate cube and figures are saved as snapshots keyed on the
+dataset version and the app's code version. Server processes load these
+snapshots instead of rebuilding them on the first visits; a code change
+leaves them unread, and the warm-up always rebuilds them from the dataset.
+"""
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+from airbnb.cache import CACHE_DIR, hash_file
+
+WARM_DIR = os.path.join(CACHE_DIR, "warm")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Sources whose changes can change the pickled cube and figures, or the layout of their classes
+CODE_SOURCES = [os.path.join(ROOT, "app.py"), os.path.join(ROOT, "airbnb", "*.py")]
+
+# In import order; the app imports the map and plotting stacks inside the sections that use them
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow", "streamlit", "plotly.express", "folium", "folium.plugins",
+                 "streamlit_folium"]
+
+# Fresh interpreter importing each module in turn, so every cost is measured cold
+IMPORT_COSTS = """
+import importlib, json, sys, time
+costs = {}
+for module in sys.argv[1:]:
+    start = time.perf_counter()
+    importlib.import_module(module)
+    costs[module] = time.perf_counter() - start
+print(json.dumps(costs))
+"""
+
+# Fresh interpreter running the script as `streamlit run` does (st.cache needs a __main__ file), rendering
+# the default section the way the first session of a new server process does
+FIRST_RENDER = """
+import runpy
+import time
+started = time.perf_counter()
+runpy.run_path("app.py", run_name="__main__")
+print(time.perf_counter() - started)
+"""
+
+log = logging.getLogger(__name__)
+
+# Cleared by warm(), which must rebuild every snapshot rather than read back the previous one
+_read_snapshots = True
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    """Hash of the app and ``airbnb`` package sources, fixed for the life of the process."""
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(path for pattern in CODE_SOURCES for path in glob.glob(pattern)):
+        digest.update(os.path.relpath(path, ROOT).encode())
+        digest.update(hash_file(path).encode())
+    return digest.hexdigest()
+
+
+def snapshot_path(name, version, directory=WARM_DIR):
+    return os.path.join(directory, "%s-%s-%s.pickle" % (name, version, code_version()))
+
+
+def load_snapshot(name, version, directory=WARM_DIR):
+    """The object saved under ``name`` for this dataset and code version, else ``None``."""
+    path = snapshot_path(name, version, directory)
+    if not _read_snapshots or not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_snapshot(name, version, obj, directory=WARM_DIR):
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot_path(name, version, directory))
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def run_python(code, *args):
+    """Last line printed by ``code`` run in a new interpreter."""
+    result = subprocess.run([sys.executable, "-c", code, *args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            check=True, universal_newlines=True)
+    return result.stdout.splitlines()[-1]
+
+
+def import_costs(modules=HEAVY_MODULES):
+    """Seconds spent importing each module in a new interpreter, on top of the ones before it.
+
+    Also compiles their bytecode and reads them into the page cache for the server process.
+    """
+    return json.loads(run_python(IMPORT_COSTS, *modules))
+
+
+def first_render_seconds():
+    """Time to first render of a new interpreter, from its first import to the end of the first section."""
+    return float(run_python(FIRST_RENDER))
+
+
+def warm():
+    """Rebuild the snapshots of every served dataset for the current code; returns the seconds spent per step."""
+    global _read_snapshots
+    _read_snapshots = False
+    timings = {"import " + module: cost for module, cost in import_costs().items()}
+
+    # Imported here: the app module is the Streamlit script, rendered headless in this process
+    import app
+
+    for version in app.served_versions():
+        start = time.perf_counter()
+        app.get_data(version)
+        timings["load dataset " + version] = time.perf_counter() - start
+
+        for name, render in app.SECTIONS.items():
+            start = time.perf_counter()
+            render(version)
+            timings["section %s (%s)" % (name, version)] = time.perf_counter() - start
+
+        # Figure keys start with their dataset version
+        figures = [(key, payload) for key, payload in app.get_figure_cache().entries() if key[0] == version]
+        save_snapshot("aggregates", version, app.get_aggregates(version))
+        save_snapshot("figures", version, figures)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm the app's caches before the server starts.")
+    parser.add_argument("--measure", action="store_true",
+                        help="report the time to first render of a new process before and after warming")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if args.measure:
+        log.info("first render before warm-up: %.0f ms", first_render_seconds() * 1000)
+    for step, seconds in warm().items():
+        log.info("%-40s %8.0f ms", step, seconds * 1000)
+    if args.measure:
+        log.info("first render after warm-up: %.0f ms", first_render_seconds() * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,164 @@
-from PIL import Image
+import json
+import logging
+import os
+import time
+
 import pandas as pd
-import matplotlib.pyplot as plt
 import streamlit as st
-import plotly.express as px
-import seaborn as sns
-sns.set_style("whitegrid")
-import folium
-from folium.plugins import HeatMap
-from streamlit_folium import st_folium, folium_static
-import json
+import streamlit.components.v1 as components
+
+from airbnb.aggregates import DIMENSIONS, MEASURES, AggregateCube
+from airbnb.availability import AvailabilityTables
+from airbnb.binning import SpatialBins
+from airbnb.crime_density import density_column, density_radii
+from airbnb.dataset import dataset_version, load_dataset
+from airbnb.figure_cache import FigureCache
+from airbnb.filters import FilterIndex
+from airbnb.hosts import HostRanking
+from airbnb.geometry import CHOROPLETH_ZOOM, simplified_neighbourhoods, with_metrics
+from airbnb.histograms import BinnedHistogram
+from airbnb.instrumentation import PROFILE_ENV, SectionProfiler, add_payload, add_rows
+from airbnb.sampling import decimate
+from airbnb.sketches import EXACT_ENV, CellSketches
+from airbnb.store import partition_path, partition_version, partitions, scan, version_partition
+from airbnb.warmup import load_snapshot
+
+# Start of this script run. The server process has already imported streamlit, pandas and pyarrow before running
+# it, so only the first run's imports of the airbnb modules above are left out of the first render time.
+RUN_STARTED = time.perf_counter()
 
 st.set_page_config(layout="wide", page_title="Airbnb New York City", page_icon="images/airbnb_logo.jpg")
-st.set_option('deprecation.showPyplotGlobalUse', False)
 
+log = logging.getLogger(__name__)
+
+# Maximum number of weighted bin centroids sent to the browser per map
+HEATMAP_POINTS = 5000
+MAP_POINTS = 3000
+
+# Point-per-row charts switch to WebGL above WEBGL_ROWS and are decimated to their point budget
+WEBGL_ROWS = 10000
+SCATTER_POINTS = 30000
+STRIP_POINTS = 8000
+
+
+# The frame is a read-only view of the memory-mapped dataset, so it is shared without hashing or copying it
+@st.cache(allow_output_mutation=True)
+def get_data(version):
+    # Partition versions name their city and snapshot; any other version is the single-file dataset
+    partition = version_partition(version)
+    return load_dataset(partition_path(*partition)) if partition else load_dataset()
 
 @st.cache
-def get_data():
-    return pd.read_csv("data/New_York_Airbnb.csv")
+def get_snapshot_summary(city, versions):
+    # Keyed on the versions of the city's partitions, so a rebuilt snapshot is read again
+    df = scan(["neighbourhood_group", "price"], cities=[city])
+    return df.groupby(["snapshot", "neighbourhood_group"], observed=True)["price"]\
+        .agg(listings="size", median_price="median").reset_index()
+
+@st.cache(allow_output_mutation=True)
+def get_aggregates(version):
+    # Saved by the warm-up (python -m airbnb.warmup) when it ran for this dataset version and code
+    cube = load_snapshot("aggregates", version)
+    return cube if cube is not None else AggregateCube(get_data(version), sketches=get_sketches(version))
+
+@st.cache(allow_output_mutation=True)
+def get_sketches(version):
+    # AIRBNB_EXACT_QUANTILES=1 answers from the rows instead, to check the sketched box plots and quantiles
+    return CellSketches(get_data(version), DIMENSIONS, MEASURES, exact=bool(os.environ.get(EXACT_ENV)))
+
+@st.cache(allow_output_mutation=True)
+def get_availability_tables(version):
+    return AvailabilityTables(get_data(version))
+
+@st.cache(allow_output_mutation=True)
+def get_price_histogram(version):
+    return BinnedHistogram(get_data(version), "price")
+
+@st.cache(allow_output_mutation=True)
+def get_host_ranking(version):
+    return HostRanking(get_data(version))
+
+@st.cache(allow_output_mutation=True)
+def get_filters(version):
+    return FilterIndex(get_data(version))
+
+@st.cache(allow_output_mutation=True)
+def get_bins(version):
+    return SpatialBins(get_data(version))
 
 @st.cache
-def get_logo_image():
-    return Image.open("images/airbnb_logo.jpg")
+def get_heatmap_points(version):
+    return get_bins(version).aggregate(budget=HEATMAP_POINTS)
+
+def served_versions():
+    """Versions of the datasets the app serves: every stored partition, else the single-file dataset."""
+    stored = partitions()
+    return [partition_version(*partition) for partition in stored] if stored else [dataset_version()]
+
+@st.cache(allow_output_mutation=True)
+def get_figure_cache():
+    figures = FigureCache()
+    for version in served_versions():
+        figures.preload(load_snapshot("figures", version) or [])
+    return figures
+
+@st.cache(allow_output_mutation=True)
+def get_startup_times():
+    return {}
+
+@st.cache(allow_output_mutation=True)
+def get_profiler():
+    return SectionProfiler.from_env()
+
+@st.cache(allow_output_mutation=True, max_entries=64)
+def get_choropleth_html(version, tiles, metric, value_range, legend_name):
+    import folium
+
+    cube = get_aggregates(version)
+    # Polygons are matched on the spatial join when the dataset has it, else on the neighbourhood name
+    key = "polygon_id" if cube.has("polygon_id") else "neighbourhood"
+    metrics = cube.frame(key, metric).round(2)
+    geo = with_metrics(simplified_neighbourhoods(CHOROPLETH_ZOOM), metrics, key=key)
+
+    map_ny = folium.Map(location=[40.7128,-73.9354], tiles=tiles, zoom_start=CHOROPLETH_ZOOM)
+    choropleth = folium.Choropleth(geo_data = geo,
+                    data=metrics[metrics[metric].between(*value_range)],
+                    columns=[key, metric],
+                    key_on='feature.properties.' + key,
+                    fill_color='YlOrRd',
+                    fill_opacity=0.7,
+                    line_opacity=0.2,
+                    legend_name=legend_name,
+    ).add_to(map_ny)
+    choropleth.geojson.add_child(folium.GeoJsonTooltip(fields=['neighbourhood', metric]))
 
-def main():
+    # Same page folium_static renders, built once per (tiles, metric, range)
+    return folium.Figure().add_child(map_ny).render()
+
+def take(df, rows):
+    add_rows(len(rows))
+    return df.take(rows)
+
+def emit(element, frame, **kwargs):
+    # Streamlit element fed a frame, counted as the frame's size when profiling
+    add_payload(lambda: frame.memory_usage(deep=True).sum())
+    return element(frame, **kwargs)
+
+def box_arguments(box):
+    # go.Box statistics of a describe() row; whiskers at Plotly's default 1.5 IQR past the quartiles, within min and max
+    iqr = box["75%"] - box["25%"]
+    return dict(q1=[box["25%"]], median=[box["50%"]], q3=[box["75%"]], mean=[box["mean"]],
+                lowerfence=[max(box["min"], box["25%"] - 1.5 * iqr)], upperfence=[min(box["max"], box["75%"] + 1.5 * iqr)])
 
-    df = get_data()
+def show_sampling_note(fig, total):
+    # The plotted row count travels in layout.meta so it is also known for cached figures
+    shown = fig.layout.meta["points"]
+    if shown < total:
+        st.caption(f"Showing {shown:,} of {total:,} listings, sampled by district and room type keeping the outliers.")
 
-    ##################### SIDEBAR #####################
+def show_sidebar():
 
-    st.sidebar.image(get_logo_image(), use_column_width=False, width=300)
+    st.sidebar.image("images/airbnb_logo.jpg", use_column_width=False, width=300)
     st.sidebar.header("Welcome!")
 
     st.sidebar.markdown(" ")
@@ -43,6 +173,9 @@ def main():
     st.sidebar.markdown("**Version:** 1.0.0")
 
 
+def show_intro(version):
+    df = get_data(version)
+
     ##################### Introducció #####################
 
     st.image("images/New-York-City-Brooklyn-Bridge-Panorama-Juergen-Roth-2.jpg", caption=None, width=None, use_column_width='always', clamp=False, channels="RGB", output_format="auto")
@@ -81,10 +214,28 @@ def main():
 
     st.markdown("Per tal de dur a terme el l'anàlisi de les dades, ho farem mitjançant un projecte de visualització de dades, on es podran veure gràfics i taules que ens ajudaran a entendre millor les dades i a respondre a les nostres preguntes.")
 
-    st.dataframe(df.head(10), width=None, height=None)
+    emit(st.dataframe, df.head(10), width=None, height=None)
 
     st.markdown("Un altre punt sobre les dades, és que permet ordenar el dataframe en fer clic a qualsevol capçalera d'una columna, una manera més flexible d'ordenar les dades per visualitzar-les.")
 
+    partition = version_partition(version)
+    snapshots = [stored for stored in partitions() if partition and stored[0] == partition[0]]
+    if len(snapshots) > 1:
+        st.header("Evolució entre captures")
+        st.markdown("Nombre d'habitatges i preu mitjà per districte a cada captura de la ciutat.")
+        versions = tuple(partition_version(*stored) for stored in snapshots)
+        emit(st.dataframe, get_snapshot_summary(partition[0], versions))
+
+
+def show_location(version):
+    import folium
+    from folium.plugins import HeatMap
+    from streamlit_folium import st_folium
+
+    df = get_data(version)
+    filters = get_filters(version)
+    bins = get_bins(version)
+
     ##################### Distribució geogràfica #####################
 
     st.header("Localització de les reserves d'Airbnb a Nova York")
@@ -92,8 +243,9 @@ def main():
     st.markdown("Veiem quina és la densitat d'habitatges disponibles segons la seva distribució geogràfica")
 
     fig = folium.Map([40.7128,-73.9354],zoom_start=10.7)
-    HeatMap(df[['latitude','longitude']].dropna(),radius=8,gradient={0.2:'blue',0.4:'purple',0.6:'orange',1.0:'red'}).add_to(fig)
+    HeatMap(get_heatmap_points(version)[['latitude','longitude','weight']],radius=8,gradient={0.2:'blue',0.4:'purple',0.6:'orange',1.0:'red'}).add_to(fig)
 
+    add_payload(lambda: len(fig.get_root().render()))
     map_data = st_folium(fig, width=1500, height=500)
 
 
@@ -104,7 +256,9 @@ def main():
     values = st.slider("Price Range ($)", float(df.price.min()), float(df.price.clip(upper=10000.).max()), (400., 1500.))
     min_nights_values = st.slider('Minimum Nights', 0, 30, (1))
     reviews = st.slider('Minimum Reviews', 0, 700, (0))
-    st.map(df.query(f"price.between{values} and minimum_nights<={min_nights_values} and number_of_reviews>={reviews}")[["latitude", "longitude"]].dropna(how="any"), zoom=10)
+    map_rows = filters.select(price=values, minimum_nights=(None, min_nights_values), number_of_reviews=(reviews, None))
+    add_rows(len(map_rows))
+    emit(st.map, bins.aggregate(map_rows, budget=MAP_POINTS)[["latitude", "longitude"]], zoom=10)
 
     st.markdown("""En general, el mapa mostra que les ubicacions al centre de la ciutat són més cares, mentre que a les afores els habitatges són més econòmics (un patró que probablement no només existeix a Nova York). A més, el centre de la ciutat
      sembla tenir el seu propi patró.""")
@@ -128,7 +282,16 @@ def main():
     st.markdown("_**Nota:** D'una manera més convenient, per filtrar les nostres dades, és possible filtrar-les a través de les següents funcions: **Price**, **Room Type**, **Minimum of Nights**, **District(Neighbourhood)**, **Host Name**, **Reviews**_")
     defaultcols = ["host_name", "price", "minimum_nights", "room_type", "neighbourhood", "number_of_reviews", "distance_to_nearest_subway"]
     cols = st.multiselect('What attributes do you need to view?', df.columns.tolist(), default=defaultcols)
-    st.dataframe(df[cols].head(10))
+    emit(st.dataframe, df[cols].head(10))
+
+
+def show_price(version):
+    import plotly.graph_objects as go
+
+    df = get_data(version)
+    cube = get_aggregates(version)
+    histogram = get_price_histogram(version)
+    figures = get_figure_cache()
 
     ##################### Preu #####################
 
@@ -138,28 +301,25 @@ def main():
     st.markdown("Veiem quina és la distribució del preu")
 
     values = st.slider("Price range", float(df.price.min()), float(df.price.clip(upper=1000.).max()), (50., 300.))
-    fig = px.histogram(df.query(f"price.between{values}"), 
-                        x="price",
-                        nbins=20, 
-                        title="Price distribution",
-                        width=1000, 
-                        height=500,
-                        color_discrete_sequence=['indianred'],
-                        opacity=0.8)
-    fig.update_xaxes(title="Price ($)")
-    fig.update_yaxes(title="No. of listings")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.5)
-    st.plotly_chart(fig)
+    def build_figure():
+        # Bars of the pre-binned counts instead of every selected row
+        counts = histogram.histogram(*values, bins=20, per_group=False)
+        fig = go.Figure(go.Bar(x=counts.price + counts.width / 2, y=counts["count"], width=counts.width,
+                               marker_color='indianred', opacity=0.8))
+        fig.update_layout(title="Price distribution", width=1000, height=500, bargap=0)
+        fig.update_xaxes(title="Price ($)")
+        fig.update_yaxes(title="No. of listings")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.5)
+        return fig
+
+    st.plotly_chart(figures.get((version, "price_histogram", (values,)), build_figure))
 
     st.markdown("""Es pot observar que la disposició del preu és molt concentrada al voltant dels 100 dòlars, amb una gran majoria de llistats que tenen un preu inferior a 200 dòlars.""")
 
     st.markdown("A continuació es mostra la distribució dels preus segons la seva localització")
 
-    data_geo = json.load(open('data/rawData/neighbourhoods.geojson'))
-
-
-    price_by_neighbourhood = df.groupby("neighbourhood")["price"].mean().reset_index()
+    price_by_neighbourhood = cube.frame("neighbourhood", "price")
 
     df_price_by_neighbourhood = pd.DataFrame(price_by_neighbourhood)
 
@@ -169,27 +329,27 @@ def main():
 
     add_select = st.selectbox("What type of map do you want to see?",("OpenStreetMap", "Stamen Terrain","Stamen Toner"))
 
-    map_ny = folium.Map(location=[40.7128,-73.9354], tiles=add_select, zoom_start=10.5)
-
     price_values = st.slider("Price range", float(df_price_by_neighbourhood.price.min()), float(df_price_by_neighbourhood.price.clip(upper=400.).max()), (50., 250.))
 
-    folium.Choropleth(geo_data = data_geo,
-                    data=df_price_by_neighbourhood.query(f"price.between{values}"),
-                    columns=['neighbourhood', 'price'],
-                    key_on='feature.properties.neighbourhood',
-                    fill_color='YlOrRd',
-                    fill_opacity=0.7,
-                    line_opacity=0.2,
-                    legend_name='Price ($)',
-    ).add_to(map_ny)
-
-    folium_static(map_ny, width=1500, height=500)
+    html = get_choropleth_html(version, add_select, "price", price_values, 'Price ($)')
+    add_payload(len(html))
+    components.html(html, width=1500, height=510)
 
     st.markdown("_**Nota:** En aquest cas s'ha realitzat un tall en el preu de la reserva en 400$, ja que el rang de 50 a 400$ inclou el 95% de les reserves fetes a Airbnb_")
     st.markdown("_**Nota:** Els barris colorejats de color negre són barris on no es disposa de les dades._")
 
 
-    #######################################################################################################################
+
+def show_districts(version):
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    df = get_data(version)
+    cube = get_aggregates(version)
+    histogram = get_price_histogram(version)
+    figures = get_figure_cache()
+
 
 
     ##################### Districtes #####################
@@ -199,38 +359,54 @@ def main():
      un comtat respectiu de l'estat de Nova York. Els boroughs de Queens i Bronx són concurrents amb els comtats del mateix nom, mentre que els boroughs de Manhattan, Brooklyn i Staten Island corresponen als de Nova York, Kings i Richmond, respectivament.""")
     st.markdown("Un altre punt important que és possible observar és que el preu mitjà al districte de Manhattan pot ser molt més alt que altres districtes. Manhattan té un preu mitjà pròxim al doble que el del districte del Bronx")
 
-    fig = px.bar(df.groupby("neighbourhood_group")["price"].mean().reset_index(), 
-                 x="neighbourhood_group", 
-                 y="price", 
-                 title="Average price by District",
-                 width=1000, 
-                 height=500,
-                 color_discrete_sequence=['indianred'],
-                 opacity=0.8)
-
-    fig.update_xaxes(title="District")
-    fig.update_yaxes(title="Average price ($)")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.5)
-    st.plotly_chart(fig)
+    def build_figure():
+        fig = px.bar(cube.frame("neighbourhood_group", "price"), 
+                     x="neighbourhood_group", 
+                     y="price", 
+                     title="Average price by District",
+                     width=1000, 
+                     height=500,
+                     color_discrete_sequence=['indianred'],
+                     opacity=0.8)
+
+        fig.update_xaxes(title="District")
+        fig.update_yaxes(title="Average price ($)")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.5)
+        return fig
 
+    st.plotly_chart(figures.get((version, "price_by_district", ()), build_figure))
 
-    fig = px.histogram(df.query(f"price.between{values}"), 
-                        x="price",
-                        nbins=20, 
-                        title="Price distribution by District",
-                        width=1000, 
-                        height=600,
-                        color="neighbourhood_group",
-                        color_discrete_sequence=px.colors.qualitative.T10,
-                        marginal="box",
-                        opacity=0.8,
-                        barmode="overlay")
-    fig.update_xaxes(title="Price ($)")
-    #fig.update_yaxes(title="No. of listings")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    st.plotly_chart(fig)
+
+    values = st.slider("Price range", float(df.price.min()), float(df.price.clip(upper=1000.).max()), (50., 300.))
+    def build_figure():
+        # Pre-binned counts and box statistics of the price range, like px.histogram(marginal="box")
+        counts = histogram.histogram(*values, bins=20)
+        stats = histogram.describe(*values).set_index("neighbourhood_group")
+        colors = px.colors.qualitative.T10
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.25, 0.75], vertical_spacing=0.02)
+        for i, borough in enumerate(histogram.groups):
+            if not stats.loc[borough, "count"]:
+                continue
+            color = colors[i % len(colors)]
+            bars = counts[counts.neighbourhood_group == borough]
+            fig.add_trace(go.Bar(x=bars.price + bars.width / 2, y=bars["count"], width=bars.width,
+                                 name=borough, legendgroup=borough, marker_color=color, opacity=0.8), row=2, col=1)
+            box = stats.loc[borough]
+            fig.add_trace(go.Box(y=[borough], **box_arguments(box),
+                                 orientation="h", name=borough, legendgroup=borough, marker_color=color,
+                                 showlegend=False), row=1, col=1)
+
+        fig.update_layout(title="Price distribution by District", width=1000, height=600, barmode="overlay",
+                          legend_title_text="neighbourhood_group")
+        fig.update_xaxes(title="Price ($)", row=2, col=1)
+        fig.update_yaxes(title="count", row=2, col=1)
+        fig.update_yaxes(showticklabels=False, row=1, col=1)
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        return fig
+
+    st.plotly_chart(figures.get((version, "price_by_district_histogram", (values,)), build_figure))
 
 
     st.markdown("""Veiem quina és la distribució del preu segons els barris. Degut a que hi ha una gran quantitat de barris, només mostrarem els 10 barris més cars i els 10 més barats.""")
@@ -238,39 +414,54 @@ def main():
     col1, col2 = st.columns(2, gap='small')
 
     with col1:
-        fig = px.bar(df.groupby("neighbourhood").price.mean().sort_values(ascending=True).reset_index().head(10),
-                    y="neighbourhood",
-                    x="price",
-                    color_discrete_sequence=['indianred'],
-                    title="Top 10 cheapest neighbourhoods",
-                    opacity=0.8,
-                    width=700,
-                    height=500)
-        fig.update_yaxes(title="Neighbourhood")
-        fig.update_xaxes(title="Average price ($)")
-        fig.update_layout(title_font_size=20)
-        fig.update_layout(title_x=0.5)
-        st.plotly_chart(fig)
+        def build_figure():
+            fig = px.bar(cube.frame("neighbourhood", "price").sort_values("price", ascending=True).head(10),
+                        y="neighbourhood",
+                        x="price",
+                        color_discrete_sequence=['indianred'],
+                        title="Top 10 cheapest neighbourhoods",
+                        opacity=0.8,
+                        width=700,
+                        height=500)
+            fig.update_yaxes(title="Neighbourhood")
+            fig.update_xaxes(title="Average price ($)")
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.5)
+            return fig
+
+        st.plotly_chart(figures.get((version, "cheapest_neighbourhoods", ()), build_figure))
 
     with col2:
-        fig = px.bar(df.groupby("neighbourhood").price.mean().sort_values(ascending=False).reset_index().head(10),
-                    y="neighbourhood",
-                    x="price",
-                    color_discrete_sequence=['indianred'],
-                    title="Top 10 most expensive neighbourhoods",
-                    opacity=0.8,
-                    width=700,
-                    height=500)
-        fig.update_yaxes(title="Neighbourhood")
-        fig.update_xaxes(title="Average price ($)")
-        fig.update_layout(title_font_size=20)
-        fig.update_layout(title_x=0.5)
-        st.plotly_chart(fig)
+        def build_figure():
+            fig = px.bar(cube.frame("neighbourhood", "price").sort_values("price", ascending=False).head(10),
+                        y="neighbourhood",
+                        x="price",
+                        color_discrete_sequence=['indianred'],
+                        title="Top 10 most expensive neighbourhoods",
+                        opacity=0.8,
+                        width=700,
+                        height=500)
+            fig.update_yaxes(title="Neighbourhood")
+            fig.update_xaxes(title="Average price ($)")
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.5)
+            return fig
+
+        st.plotly_chart(figures.get((version, "most_expensive_neighbourhoods", ()), build_figure))
 
     st.markdown("""El barri més car de Nova York és ** Fort Wadsworth **, amb un preu mitjà de 800 dòlars per dia. En canvi el barri més econòmic és el Bull's Head, amb un preu mitjà de 48 dòlars.""")
 
 
 
+def show_availability(version):
+    import plotly.express as px
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    df = get_data(version)
+    tables = get_availability_tables(version)
+    figures = get_figure_cache()
+
     ##################### Disponibilitat #####################
 
     st.header("Disponibilitat i distribució")
@@ -279,15 +470,8 @@ def main():
 
     neighborhood = st.radio("District", df.neighbourhood_group.unique())
     is_expensive = st.checkbox("Expensive Listings")
-    is_expensive = " and price<100" if not is_expensive else ""
 
-    @st.cache
-    def get_availability(show_exp, neighborhood):
-        return df.query(f"""neighbourhood_group==@neighborhood{is_expensive}\
-            and availability_365>0""").availability_365.describe(\
-                percentiles=[.1, .25, .5, .75, .9, .99]).to_frame().T
-
-    st.table(get_availability(is_expensive, neighborhood))
+    emit(st.table, tables.describe(neighborhood, is_expensive))
     st.markdown("_**Nota:** Hi ha 18431 registres amb *disponibilitat_365** 0 (zero). En aquest cas els he ignorat._")
     st.markdown("""Amb 156 dies, Manhattan té la mitjana de disponibilitat més baixa. Amb 223, Staten Island té la mitjana de disponibilitat més alta. Si incloem els habitatges més cars (més de 100 dòlars per dia),
      els números són 164 per Brooklyn i 225 per Staten Island.""")
@@ -295,51 +479,84 @@ def main():
     st.header("Disponibilitat per districte")
     st.markdown("""Veiem quina és la distribució de la disponibilitat segons el districte""")
 
-    fig = px.histogram(df.query(f"availability_365>0{is_expensive}"), 
-                        x="availability_365",
-                        nbins=20, 
-                        title="Availability distribution by District",
-                        width=1000, 
-                        height=600,
-                        color="neighbourhood_group",
-                        color_discrete_sequence=px.colors.qualitative.T10,
-                        marginal="box",
-                        opacity=0.8,
-                        barmode="overlay")
+    days = st.slider("Availability range (days)", 1, 365, (1, 365))
+
+    def build_figure():
+        # Bars and box plots drawn from the precomputed counts, like px.histogram(marginal="box")
+        histogram = tables.histogram(is_expensive, *days)
+        stats = tables.describe_range(is_expensive, *days).set_index("neighbourhood_group")
+        colors = px.colors.qualitative.T10
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.25, 0.75], vertical_spacing=0.02)
+        for i, borough in enumerate(tables.boroughs):
+            if not stats.loc[borough, "count"]:
+                continue
+            color = colors[i % len(colors)]
+            counts = histogram[histogram.neighbourhood_group == borough]
+            fig.add_trace(go.Bar(x=counts.availability_365 + counts.width / 2, y=counts["count"], width=counts.width,
+                                 name=borough, legendgroup=borough, marker_color=color, opacity=0.8), row=2, col=1)
+            box = stats.loc[borough]
+            fig.add_trace(go.Box(y=[borough], **box_arguments(box),
+                                 orientation="h", name=borough, legendgroup=borough, marker_color=color,
+                                 showlegend=False), row=1, col=1)
+
+        fig.update_layout(title="Availability distribution by District", width=1000, height=600, barmode="overlay",
+                          legend_title_text="neighbourhood_group")
+        fig.update_xaxes(title="Availability (days)", row=2, col=1)
+        fig.update_yaxes(title="count", row=2, col=1)
+        fig.update_yaxes(showticklabels=False, row=1, col=1)
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        return fig
 
-    fig.update_xaxes(title="Availability (days)")
-    #fig.update_yaxes(title="No. of listings")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    st.plotly_chart(fig)
+    st.plotly_chart(figures.get((version, "availability_histogram", (is_expensive, days)), build_figure))
 
     st.markdown("""Veiem que la majoria dels llistats tenen una disponibilitat de 0 a 100 dies. Els llistats de Brooklyn tenen una distribució més concentrada que els de Manhattan.""")
     st.markdown("""Si incloem els habitatges més cars (més de 100 dòlars per dia), la distribució és molt similar.""")
 
+
+def show_minimum_nights(version):
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    sketches = get_sketches(version)
+    figures = get_figure_cache()
+
     ##################### Estança mínima #####################
 
     st.header("Estança mínima")
     st.markdown("""L'atribut **minimum_nights** ens indica el nombre mínim de nits que cal reservar per a poder allotjar-se a l'habitatge.""")
 
-    fig = px.box(df.query(f"minimum_nights<15"), 
-                x="neighbourhood_group", 
-                y="minimum_nights", 
-                color="neighbourhood_group", 
-                color_discrete_sequence=px.colors.qualitative.T10, 
-                title="Minimum nights by District",
-                width=1000, 
-                height=600)
-
-    fig.update_xaxes(title="District")
-    fig.update_yaxes(title="Minimum nights")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    st.plotly_chart(fig)
+    def build_figure():
+        # Boxes merged from the per-cell sketches (exact here: minimum_nights is a small integer), like px.box
+        boxes = sketches.describe("minimum_nights", by="neighbourhood_group", at_most=14)
+        colors = px.colors.qualitative.T10
+        fig = go.Figure()
+        for i, box in boxes.iterrows():
+            fig.add_trace(go.Box(x=[box["neighbourhood_group"]], **box_arguments(box),
+                                 name=box["neighbourhood_group"], marker_color=colors[i % len(colors)]))
+
+        fig.update_layout(title="Minimum nights by District", width=1000, height=600,
+                          legend_title_text="neighbourhood_group")
+        fig.update_xaxes(title="District")
+        fig.update_yaxes(title="Minimum nights")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        return fig
+
+    st.plotly_chart(figures.get((version, "minimum_nights_box", ()), build_figure))
 
 
     st.markdown("_**Nota:** Hi ha 11 registres amb *minimum_nights** 0 (zero). En aquest cas els he ignorat. D'altre banda, s'ha filtrat el dataframe per obtenir només els registres amb una reserva mínima inferior als 15 dies, ja que és el periode habitual de vacances_")
     st.markdown("""Com es pot observar, la mitjana de nits mínimes per reservar a tots els districtes és de 2 nits. En el cas de Manhattan o Brooklyn, s'observa que hi ha força regsitres al voltant de les 3 nits mínimes""")
 
+
+def show_room_types(version):
+    import plotly.express as px
+
+    df = get_data(version)
+    cube = get_aggregates(version)
+    figures = get_figure_cache()
+
     ##################### Room types by district #####################
 
     st.header("Tipus d'habitatge per districte")
@@ -349,24 +566,27 @@ def main():
     st.markdown("""revisem la relació entre el tipus de propietat i el veïnat. La pregunta principal que pretenem respondre és si els diferents districtes constitueixen diferents tipus de lloguer. Tot i que en el conjunt de dades expandit hi ha més de 20 tipus,
      ens centrarem en el top 4 pel seu recompte total a la ciutat i la comprensió de la seva distribució en cada districte.""")
 
-    room_types_df = df.groupby(['neighbourhood_group', 'room_type']).size().reset_index(name='Quantity')
+    room_types_df = cube.frame(['neighbourhood_group', 'room_type'], "count").rename(columns={'count': 'Quantity'})
     room_types_df = room_types_df.rename(columns={'neighbourhood_group': 'District', 'room_type':'Room Type'})
-    room_types_df['Percentage'] = room_types_df.groupby(['District'])['Quantity'].apply(lambda x:100 * x / float(x.sum()))
-
-    fig = px.bar(room_types_df,
-                x="District",
-                y="Percentage",
-                color="Room Type",
-                color_discrete_sequence=px.colors.qualitative.T10,
-                title="Room types by District",
-                width=1000,
-                height=600)
-
-    fig.update_xaxes(title="District")
-    fig.update_yaxes(title="Percentage")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    st.plotly_chart(fig)
+    room_types_df['Percentage'] = room_types_df.groupby(['District'], observed=True)['Quantity'].apply(lambda x:100 * x / float(x.sum()))
+
+    def build_figure():
+        fig = px.bar(room_types_df,
+                    x="District",
+                    y="Percentage",
+                    color="Room Type",
+                    color_discrete_sequence=px.colors.qualitative.T10,
+                    title="Room types by District",
+                    width=1000,
+                    height=600)
+
+        fig.update_xaxes(title="District")
+        fig.update_yaxes(title="Percentage")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        return fig
+
+    st.plotly_chart(figures.get((version, "room_types", ()), build_figure))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""Podem veure que els llistats de *Private Room* són més alts en nombre en tots els districtes, excepte Manhattan i Staten Island. Staten Island té més propietat d'estil «House» que «Apartments», per tant, probablement els únics
@@ -382,13 +602,13 @@ def main():
     st.markdown("""L'atribut **price** ens indica el preu de l'habitatge en dòlars.""")
     st.markdown("""Veiem quin és el preu mitjà per tipus d'habitatge.""")
 
-    avg_price_room = df.groupby("room_type").price.mean().reset_index()\
+    avg_price_room = cube.frame("room_type", "price")\
           .round(2).sort_values("price", ascending=False)\
           .assign(avg_price=lambda x: x.pop("price").apply(lambda y: "%.2f" % y))
 
     avg_price_room = avg_price_room.rename(columns={'room_type':'Room Type', 'avg_price': 'Average Price ($)', })
 
-    st.table(avg_price_room)
+    emit(st.table, avg_price_room)
 
     st.markdown("Com es pot observar, el preu mitjà per *Entire home/apt* és de 211,79 dòlars, seguit de *Private Room* amb 89,78 dòlars i *Shared Room* amb 70,12 dòlars.")
     st.markdown("""Podem observar que el preu mig per un apartament està molt per sobre del preu mitjà per una habitació privada. Això pot ser degut a que els apartaments són més grans i tenen més espai, per tant, el preu per persona és més baix. I que aquest últims es troben
@@ -397,48 +617,60 @@ def main():
     st.markdown("Veiem quina és la distribució dels preus per tipus d'habitatge i districte.")
 
 
-    avg_price_district = df.groupby(["neighbourhood_group", "room_type"]).price.mean().reset_index()\
+    avg_price_district = cube.frame(["neighbourhood_group", "room_type"], "price")\
             .round(2).sort_values("price", ascending=True)\
             .assign(avg_price=lambda x: x.pop("price").apply(lambda y: "%.2f" % y))
 
     avg_price_district = avg_price_district.rename(columns={'neighbourhood_group':'District', 'room_type':'Room Type', 'avg_price': 'Average Price ($)' })
 
-    fig = px.bar(avg_price_district,
-                x="District", 
-                y="Average Price ($)", 
-                color="Room Type", 
-                color_discrete_sequence=px.colors.qualitative.T10, 
-                title="Price by Room Type and District", 
-                width=1000, 
-                height=600)
-
-    fig.update_xaxes(title="District")
-    fig.update_yaxes(title="Price ($)")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    fig.update_layout(barmode='group')
-    st.plotly_chart(fig)
+    def build_figure():
+        fig = px.bar(avg_price_district,
+                    x="District", 
+                    y="Average Price ($)", 
+                    color="Room Type", 
+                    color_discrete_sequence=px.colors.qualitative.T10, 
+                    title="Price by Room Type and District", 
+                    width=1000, 
+                    height=600)
+
+        fig.update_xaxes(title="District")
+        fig.update_yaxes(title="Price ($)")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        fig.update_layout(barmode='group')
+        return fig
+
+    st.plotly_chart(figures.get((version, "price_by_room_type", ()), build_figure))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""El preu mitjà per *Entire home/apt* és més elevat a Manhattan, seguit de Brooklyn i Queens. Bronx té el preu mitjà més baix per aquest tipus d'habitatge.""")
     st.markdown("""El preu mitjà per *Private Room* és més elevat a Manhattan, seguit de Brooklyn i Queens. Staten Island té el preu mitjà més baix per aquest tipus d'habitatge.""")
     st.markdown("""El preu mitjà per *Shared Room* és més elevat a Manhattan, seguit de Brooklyn i Bronx. Staten Island té el preu mitjà més baix per aquest tipus d'habitatge.""")
 
-    fig = px.strip(df,
-                x="room_type",
-                y="reviews_per_month",
-                color="neighbourhood_group",
-                facet_row_spacing=0.1,
-                color_discrete_sequence=px.colors.qualitative.T10,
-                title="Reviews per Month by Room Type and District",
-                width=1000,
-                height=600)
-
-    fig.update_xaxes(title="Room Type")
-    fig.update_yaxes(title="Reviews per Month")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
+    def build_figure():
+        # px.strip has no WebGL mode, so above the budget it is only decimated
+        add_rows(len(df))
+        sample = decimate(df, STRIP_POINTS, ["reviews_per_month"])
+        fig = px.strip(sample,
+                    x="room_type",
+                    y="reviews_per_month",
+                    color="neighbourhood_group",
+                    facet_row_spacing=0.1,
+                    color_discrete_sequence=px.colors.qualitative.T10,
+                    title="Reviews per Month by Room Type and District",
+                    width=1000,
+                    height=600)
+
+        fig.update_xaxes(title="Room Type")
+        fig.update_yaxes(title="Reviews per Month")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        fig.update_layout(meta={"points": len(sample)})
+        return fig
+
+    fig = figures.get((version, "reviews_per_month_strip", ()), build_figure)
     st.plotly_chart(fig)
+    show_sampling_note(fig, len(df))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""Els apartaments *Entire home/apt* tenen més valoracions per mes a Manhattan, seguit de Brooklyn i Queens. Bronx té el menor nombre de valoracions per mes per aquest tipus d'habitatge.""")
@@ -447,18 +679,27 @@ def main():
     st.markdown(""".""")
 
 
+
+def show_hosts(version):
+    import plotly.express as px
+
+    ranking = get_host_ranking(version)
+    figures = get_figure_cache()
+
     ##################### Most Rated Hosts #####################
 
     st.header("Els millors amfitrions")
 
-    st.markdown("""L'atribut **host_name** ens indica el nom de l'amfitrió.""")
-    st.markdown("""Veiem quins són els amfitrions amb més valoracions.""")
+    st.markdown("""L'atribut **host_name** ens indica el nom de l'amfitrió. Com que diversos amfitrions comparteixen nom, els identifiquem pel seu **host_id**.""")
+    st.markdown("""Veiem quins són els amfitrions amb més valoracions, més habitatges o més ingressos estimats.""")
 
-    top_hosts = df.groupby("host_name").number_of_reviews.count().reset_index()\
-            .sort_values("number_of_reviews", ascending=False)\
-            .assign(count=lambda x: x.pop("number_of_reviews").apply(lambda y: "%.0f" % y))
+    metrics = {"reviews": "Number of Reviews", "listings": "Number of Listings", "revenue": "Estimated Revenue ($/year)"}
+    by = st.radio("Rank hosts by", list(metrics), format_func=metrics.get, horizontal=True)
 
-    top_hosts = top_hosts.rename(columns={'host_id': 'Host Id', 'host_name':'Host Name', 'count': 'Number of Reviews', })
+    top_hosts = ranking.top(10, by)
+    top_hosts = top_hosts[["host_id", "host_name", by]].assign(**{by: top_hosts[by].apply(lambda y: "%.0f" % y)})
+
+    top_hosts = top_hosts.rename(columns={'host_id': 'Host Id', 'host_name':'Host Name', by: metrics[by]})
 
     col1, col2 = st.columns(2)
 
@@ -470,24 +711,38 @@ def main():
         st.markdown("")
         st.markdown("")
 
-        st.table(top_hosts.head(10))
+        emit(st.table, top_hosts)
 
 
     with col2:
-        fig = px.bar(df.groupby("host_name").number_of_reviews.count().sort_values(ascending=False).reset_index().head(5),
-                x="host_name", 
-                y="number_of_reviews",
-                color_discrete_sequence=['indianred'], 
-                title="Top 5 Hosts", 
-                width=800, 
-                height=600)
-
-        fig.update_xaxes(title="Host Name")
-        fig.update_yaxes(title="Number of Reviews")
-        fig.update_layout(title_font_size=20)
-        fig.update_layout(title_x=0.45)
-        #fig.update_layout(barmode='group')
-        st.plotly_chart(fig)
+        def build_figure():
+            # Names are not unique, so each bar is labelled with the host id too
+            top = ranking.top(5, by).assign(host=lambda x: x.host_name.fillna("?") + " (" + x.host_id.astype(str) + ")")
+            fig = px.bar(top,
+                    x="host", 
+                    y=by,
+                    color_discrete_sequence=['indianred'], 
+                    title="Top 5 Hosts", 
+                    width=800, 
+                    height=600)
+
+            fig.update_xaxes(title="Host Name")
+            fig.update_yaxes(title=metrics[by])
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.45)
+            #fig.update_layout(barmode='group')
+            return fig
+
+        st.plotly_chart(figures.get((version, "top_hosts", (by,)), build_figure))
+
+
+def show_subway(version):
+    import plotly.express as px
+
+    df = get_data(version)
+    cube = get_aggregates(version)
+    filters = get_filters(version)
+    figures = get_figure_cache()
 
     ##################### Subway Station distance #####################
 
@@ -496,7 +751,7 @@ def main():
     st.markdown("""L'atribut **neighbourhood_group** ens indica el districte on es troba l'habitatge.""")
     st.markdown("""Veiem quina és la distància mitjana a la estació de metro més propera segons el districte on està localitzat l'habitatge.""")
 
-    avg_distance = df.groupby("neighbourhood_group")["distance_to_nearest_subway"].mean().reset_index()\
+    avg_distance = cube.frame("neighbourhood_group", "distance_to_nearest_subway")\
             .round(2).sort_values("distance_to_nearest_subway", ascending=True)\
             .assign(avg_distance=lambda x: x.pop("distance_to_nearest_subway").apply(lambda y: "%.2f" % y))
 
@@ -512,49 +767,55 @@ def main():
         st.markdown("")
         st.markdown("")
 
-        st.table(avg_distance)
+        emit(st.table, avg_distance)
 
     with col2:    
 
-        fig = px.bar(avg_distance,
-                    x="District", 
-                    y="Average Distance (km)", 
-                    color_discrete_sequence=['indianred'], 
-                    title="Average Distance to Subway Station by District", 
-                    width=700, 
-                    height=400)
+        def build_figure():
+            fig = px.bar(avg_distance,
+                        x="District", 
+                        y="Average Distance (km)", 
+                        color_discrete_sequence=['indianred'], 
+                        title="Average Distance to Subway Station by District", 
+                        width=700, 
+                        height=400)
 
-        fig.update_xaxes(title="District")
-        fig.update_yaxes(title="Distance (km)")
-        fig.update_layout(title_font_size=20)
-        fig.update_layout(title_x=0.45)
-        #fig.update_layout(barmode='group')
-        st.plotly_chart(fig)
+            fig.update_xaxes(title="District")
+            fig.update_yaxes(title="Distance (km)")
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.45)
+            #fig.update_layout(barmode='group')
+            return fig
+
+        st.plotly_chart(figures.get((version, "distance_by_district", ()), build_figure))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""La distància mitjana a la estació de metro més propera és més elevada a Staten Island, seguit de Queens i Bronx. Manhattan té la distància mitjana més baixa, próxima a 100 metres. Això té tot
      el sentit, ja que Manhattan és el districte més petit i el que té més estacions de metro.""")
 
-    avg_distance = df.groupby(["neighbourhood_group", "neighbourhood" ])["distance_to_nearest_subway"].mean().reset_index()\
+    avg_distance = cube.frame(["neighbourhood_group", "neighbourhood"], "distance_to_nearest_subway")\
             .round(2).sort_values("distance_to_nearest_subway", ascending=True)\
             .assign(avg_distance=lambda x: x.pop("distance_to_nearest_subway").apply(lambda y: "%.2f" % y))
 
     avg_distance = avg_distance.rename(columns={'neighbourhood':'Neighbourhood', 'avg_distance': 'Average Distance (km)' })
 
-    fig = px.bar(avg_distance,
-                x="Neighbourhood", 
-                y="Average Distance (km)",
-                color = "neighbourhood_group", 
-                color_discrete_sequence=px.colors.qualitative.T10, 
-                title="Average Distance to Subway Station by District and Neightbourhood", 
-                width=1500, 
-                height=600)
-
-    fig.update_xaxes(title="Neighbourhood")
-    fig.update_yaxes(title="Distance (km)")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
-    st.plotly_chart(fig)
+    def build_figure():
+        fig = px.bar(avg_distance,
+                    x="Neighbourhood", 
+                    y="Average Distance (km)",
+                    color = "neighbourhood_group", 
+                    color_discrete_sequence=px.colors.qualitative.T10, 
+                    title="Average Distance to Subway Station by District and Neightbourhood", 
+                    width=1500, 
+                    height=600)
+
+        fig.update_xaxes(title="Neighbourhood")
+        fig.update_yaxes(title="Distance (km)")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        return fig
+
+    st.plotly_chart(figures.get((version, "distance_by_neighbourhood", ()), build_figure))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""Tal i com hem pogut observar amb el gràfic anterior, tots els habitatges dins del districte de Manhattan es troben a menys de 300m d'una estació de metro. En canvi, a mesura que ens allunyem del centre de la ciutat,
@@ -568,20 +829,30 @@ def main():
 
     values = st.slider("Distance to Subway Station (km)", float(df.distance_to_nearest_subway.min()), float(df.distance_to_nearest_subway.clip(upper=15.).max()), (0.1, 3.))
 
-    fig = px.scatter(df.query(f"distance_to_nearest_subway>={values[0]} & distance_to_nearest_subway<={values[1]}"), 
-                    x="distance_to_nearest_subway", 
-                    y="price", 
-                    color="neighbourhood_group", 
-                    color_discrete_sequence=px.colors.qualitative.T10, 
-                    title="Price vs Distance to Subway Station", 
-                    width=1500, 
-                    height=600)
+    distance_rows = filters.select(distance_to_nearest_subway=values)
+
+    def build_figure():
+        sample = decimate(take(df, distance_rows), SCATTER_POINTS, ["distance_to_nearest_subway", "price"])
+        fig = px.scatter(sample, 
+                        x="distance_to_nearest_subway", 
+                        y="price", 
+                        color="neighbourhood_group", 
+                        color_discrete_sequence=px.colors.qualitative.T10, 
+                        title="Price vs Distance to Subway Station", 
+                        render_mode="webgl" if len(distance_rows) > WEBGL_ROWS else "svg",
+                        width=1500, 
+                        height=600)
+
+        fig.update_xaxes(title="Distance (km)")
+        fig.update_yaxes(title="Price ($)")
+        fig.update_layout(title_font_size=20)
+        fig.update_layout(title_x=0.45)
+        fig.update_layout(meta={"points": len(sample)})
+        return fig
 
-    fig.update_xaxes(title="Distance (km)")
-    fig.update_yaxes(title="Price ($)")
-    fig.update_layout(title_font_size=20)
-    fig.update_layout(title_x=0.45)
+    fig = figures.get((version, "price_vs_distance", (values,)), build_figure)
     st.plotly_chart(fig)
+    show_sampling_note(fig, len(distance_rows))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""El preu de l'habitatge és més elevat a prop de les estacions de metro. Això té tot el sentit, ja que a prop de les estacions de metro hi ha més activitat, i per tant, hi ha més demanda d'habitatges.""")
@@ -593,29 +864,28 @@ def main():
 
     ################################################################################################################
 
-    distance_to_subway = df.groupby("neighbourhood")["distance_to_nearest_subway"].mean().reset_index()
+    distance_to_subway = cube.frame("neighbourhood", "distance_to_nearest_subway")
 
     df_distance_by_neighbourhood = pd.DataFrame(distance_to_subway)
 
-    map_nyork = folium.Map(location=[40.7128,-73.9354], tiles=add_select, zoom_start=10.5)
+    add_select = st.selectbox("What type of map do you want to see?",("OpenStreetMap", "Stamen Terrain","Stamen Toner"))
 
     distance_values = st.slider("Distance range", float(df_distance_by_neighbourhood.distance_to_nearest_subway.min()), float(df_distance_by_neighbourhood.distance_to_nearest_subway.clip(upper=5.).max()), (0., 1.))
 
-    folium.Choropleth(geo_data = data_geo,
-                    data=df_distance_by_neighbourhood.query(f"distance_to_nearest_subway.between{distance_values}"),
-                    columns=['neighbourhood', 'distance_to_nearest_subway'],
-                    key_on='feature.properties.neighbourhood',
-                    fill_color='YlOrRd',
-                    fill_opacity=0.7,
-                    line_opacity=0.2,
-                    legend_name='Distance (km)',
-    ).add_to(map_nyork)
-
-    folium_static(map_nyork, width=1500, height=500)
+    html = get_choropleth_html(version, add_select, "distance_to_nearest_subway", distance_values, 'Distance (km)')
+    add_payload(len(html))
+    components.html(html, width=1500, height=510)
 
     st.markdown("_**Nota:** En aquest cas s'ha realitzat un tall en la distància a l'estació de metro més propera en 5 km_. Les distàncies predeterminades són dins del rang  de 0 a 1 km._")
     st.markdown("_**Nota:** Els barris colorejats de color negre són barris on no es disposa de les dades, o bé están fora de rang mostrat al mapa._")
 
+
+def show_crime(version):
+    import plotly.express as px
+
+    df = get_data(version)
+    figures = get_figure_cache()
+
     ################################################################################################################
 
     ##############################Criminality Index#######################################
@@ -624,6 +894,7 @@ def main():
 
     st.markdown("Veiem quina és la distribució de la criminalitat per districte.")
 
+    add_rows(len(df))
     df_criminality = df[["neighbourhood_group", "crimes"]]
     df_criminality = df_criminality.drop_duplicates(subset = "crimes").sort_values(by = "crimes", ascending = False)
 
@@ -637,23 +908,26 @@ def main():
         st.markdown("")
         st.markdown("")
 
-        st.table(df_criminality)
+        emit(st.table, df_criminality)
 
     with col2:
 
-        fig = px.bar(df_criminality,
-                    x="neighbourhood_group",
-                    y="crimes",
-                    color_discrete_sequence=['indianred'],
-                    title="Total crimes by District",
-                    width=700,
-                    height=400)
+        def build_figure():
+            fig = px.bar(df_criminality,
+                        x="neighbourhood_group",
+                        y="crimes",
+                        color_discrete_sequence=['indianred'],
+                        title="Total crimes by District",
+                        width=700,
+                        height=400)
 
-        fig.update_xaxes(title="District")
-        fig.update_yaxes(title="Total crimes by District")
-        fig.update_layout(title_font_size=20)
-        fig.update_layout(title_x=0.45)
-        st.plotly_chart(fig)
+            fig.update_xaxes(title="District")
+            fig.update_yaxes(title="Total crimes by District")
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.45)
+            return fig
+
+        st.plotly_chart(figures.get((version, "crimes_by_district", ()), build_figure))
 
     st.markdown("Algunes observacions clau del gràfic són:")
     st.markdown("""El districte de Brooklyn és el que té més criminalitat, seguit de Manhattan. Això té sentit, ja que en aquest cas no es distingeiex entre la tipologia del crim. En aquest sentit, Brooklyn i Manhattan són
@@ -661,6 +935,37 @@ def main():
     st.markdown("""Per poder fer un estudi en profunditat i poder relacionar l'índex de criminalitat amb el preu dels habitatges, hauríem de discernir entre la tipologia de crims, ja que no és el mateix un assessinat que un robatori del telèfon.
      S'hauria de fer un estudi de criminalitat per cada tipologia de crim.""")
 
+    radii = density_radii(df.columns)
+    if radii:
+        st.markdown("""Amb les denúncies geolocalitzades podem comptar, per a cada allotjament, els crims comesos al seu voltant
+         i separar-los per tipologia. Veiem la mitjana per districte.""")
+
+        radius = st.selectbox("Radius (m)", radii, index=len(radii) // 2)
+        prefix = density_column(radius)
+        columns = [col for col in df.columns if col == prefix or col.startswith(prefix + "_")]
+
+        def build_figure():
+            add_rows(len(df))
+            means = df.groupby("neighbourhood_group", observed=True)[columns].mean()
+            means = means.rename(columns=lambda col: col[len(prefix) + 1:] or "all").reset_index()
+            means = means.melt(id_vars="neighbourhood_group", var_name="category", value_name="crimes")
+            fig = px.bar(means,
+                        x="neighbourhood_group",
+                        y="crimes",
+                        color="category",
+                        barmode="group",
+                        title="Mean crimes within %d m of a listing" % radius,
+                        width=900,
+                        height=450)
+
+            fig.update_xaxes(title="District")
+            fig.update_yaxes(title="Crimes within %d m" % radius)
+            fig.update_layout(title_font_size=20)
+            fig.update_layout(title_x=0.45)
+            return fig
+
+        st.plotly_chart(figures.get((version, "crimes_around_listings", (radius,)), build_figure))
+
     st.markdown("Conclusions")
 
     st.markdown("A través d'aquest projecte d'anàlisi i visualització de dades exploratòries, vam obtenir diverses idees interessants sobre el mercat de lloguer d'Airbnb. A continuació resumirem les respostes a les preguntes que volíem respondre al començament del projecte:")
@@ -693,5 +998,64 @@ def main():
     if btn:
         st.balloons()
 
+SECTIONS = {
+    "Introducció": show_intro,
+    "Localització": show_location,
+    "Preu": show_price,
+    "Districtes": show_districts,
+    "Disponibilitat": show_availability,
+    "Estança mínima": show_minimum_nights,
+    "Tipus d'habitatge": show_room_types,
+    "Amfitrions": show_hosts,
+    "Metro": show_subway,
+    "Criminalitat i conclusions": show_crime,
+}
+
+def main():
+
+    debug = bool(st.experimental_get_query_params().get("debug"))
+
+    show_sidebar()
+
+    stored = partitions()
+    if stored:
+        # Each snapshot is its own memory-mapped partition, so switching maps one file and never loads them all
+        city = st.sidebar.selectbox("City", sorted({city for city, _ in stored}))
+        snapshots = [snapshot for stored_city, snapshot in stored if stored_city == city]
+        snapshot = st.sidebar.selectbox("Snapshot", snapshots, index=len(snapshots) - 1)
+        version = partition_version(city, snapshot)
+    else:
+        version = dataset_version()
+
+    # Only the selected section runs, so a widget only recomputes the section it belongs to
+    section = st.sidebar.radio("Secció", list(SECTIONS))
+
+    # Profiled for ?debug=1 sessions, or for every session when AIRBNB_PROFILE is set
+    if debug or os.environ.get(PROFILE_ENV):
+        with get_profiler().measure(section, version=version) as record:
+            SECTIONS[section](version)
+    else:
+        SECTIONS[section](version)
+
+    startup = get_startup_times()
+    if not startup:
+        # Imports, data load and the first section of the first run in this server process
+        startup["first_render_ms"] = round((time.perf_counter() - RUN_STARTED) * 1000, 1)
+        log.info("first render %.1f ms after the script started", startup["first_render_ms"])
+
+    # Profiles and cache counters for sizing, only shown with ?debug=1 in the URL
+    if debug:
+        profiler = get_profiler()
+        st.sidebar.markdown("**This rerun**")
+        st.sidebar.json(record)
+        st.sidebar.markdown("**Sections, last %d profiled reruns**" % profiler.window)
+        st.sidebar.dataframe(profiler.summary_frame())
+        st.sidebar.download_button("Export section metrics", json.dumps(profiler.summary(), indent=1),
+                                   file_name="section_metrics.json", mime="application/json")
+        st.sidebar.markdown("**Startup**")
+        st.sidebar.json(startup)
+        st.sidebar.markdown("**Figure cache**")
+        st.sidebar.json(get_figure_cache().stats())
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,121 @@
+"""Load test of the aggregate API served from a single core.
+
+    python -m benchmarks.bench_api [--connections 32] [--seconds 10] [--revalidate]
+    python -m benchmarks.bench_api --url http://127.0.0.1:8600
+
+Unless ``--url`` points at a running server, starts ``python -m airbnb.api``
+pinned to one CPU (Linux) and waits for it to answer. Keeps ``--connections``
+requests in flight over the API endpoints for ``--seconds`` and reports
+requests/second and latency percentiles per endpoint. With ``--revalidate``
+clients send the ETag of their last response, as browsers and caches do, so
+most answers are 304s.
+"""
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+import numpy as np
+
+PORT = 8611
+
+PATHS = [
+    "/price/neighbourhoods",
+    "/availability/percentiles?expensive=0",
+    "/availability/percentiles?expensive=1",
+    "/room-types",
+    "/subway/distance",
+    "/crime/totals",
+    "/aggregates?by=neighbourhood_group,room_type&measure=price&stat=mean",
+    "/hosts/top?by=reviews&k=10",
+]
+
+
+def start_server(port, core=0):
+    """``airbnb.api`` in a child process restricted to CPU ``core`` where the platform allows it."""
+    pin = (lambda: os.sched_setaffinity(0, {core})) if hasattr(os, "sched_setaffinity") else None
+    return subprocess.Popen([sys.executable, "-m", "airbnb.api", "--port", str(port)], preexec_fn=pin)
+
+
+async def wait_ready(session, url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url + "/version") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("API at %s did not start" % url)
+        await asyncio.sleep(0.5)
+
+
+async def client(session, url, paths, deadline, revalidate, latencies, statuses, offset):
+    etags = {}
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        headers = {"If-None-Match": etags[path]} if revalidate and path in etags else {}
+        start = time.perf_counter()
+        async with session.get(url + path, headers=headers) as response:
+            await response.read()
+        latencies[path].append(time.perf_counter() - start)
+        statuses[response.status] += 1
+        if "ETag" in response.headers:
+            etags[path] = response.headers["ETag"]
+
+
+async def load(url, connections, seconds, revalidate, paths=PATHS):
+    latencies = collections.defaultdict(list)
+    statuses = collections.Counter()
+    connector = aiohttp.TCPConnector(limit=connections)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, url)
+        # One untimed pass, so every body is serialised before the clock starts
+        for path in paths:
+            async with session.get(url + path) as response:
+                await response.read()
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(*[client(session, url, paths, deadline, revalidate, latencies, statuses, i)
+                               for i in range(connections)])
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def report(latencies, statuses, elapsed):
+    total = sum(len(values) for values in latencies.values())
+    print(f"{'endpoint':<72}{'requests':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for path, values in latencies.items():
+        ms = np.array(values) * 1000
+        print(f"{path:<72}{len(ms):>9}{np.percentile(ms, 50):>9.2f}{np.percentile(ms, 99):>9.2f}")
+    print("statuses: " + ", ".join("%d x %d" % item for item in sorted(statuses.items())))
+    print(f"{total} requests in {elapsed:.1f} s: {total / elapsed:.0f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="API to load instead of starting one")
+    parser.add_argument("--connections", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--revalidate", action="store_true", help="send If-None-Match with the last ETag")
+    args = parser.parse_args()
+
+    server = None if args.url else start_server(PORT)
+    url = args.url or "http://127.0.0.1:%d" % PORT
+    try:
+        report(*asyncio.run(load(url, args.connections, args.seconds, args.revalidate)))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Complaints around every listing: grid build and radius queries, checked against exact counts.
+
+    python -m benchmarks.bench_crime_density [--complaints 2000000] [--listings 400000] [--radius 250 500 1000]
+    python -m benchmarks.bench_crime_density --crime data/rawData/NYPD_Complaint_Data_Historic.csv --year 2019
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from airbnb.crime_density import RADII_METRES, ComplaintGrid, crime_density, density_column
+from airbnb.subway import haversine
+from benchmarks.synthetic import OFFENSES, synthetic_listings
+
+CHUNK = 500_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--crime", help="NYPD complaints CSV; synthetic complaints when omitted")
+    parser.add_argument("--year", type=int, default=2019)
+    parser.add_argument("--complaints", type=int, default=2_000_000)
+    parser.add_argument("--listings", type=int, default=400_000)
+    parser.add_argument("--radius", type=int, nargs="+", default=RADII_METRES)
+    parser.add_argument("--check", type=int, default=50, help="listings compared with exact haversine counts")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.crime:
+        start = time.perf_counter()
+        grid = ComplaintGrid.from_complaints(args.crime, args.year)
+        built = time.perf_counter() - start
+        complaints = None
+    else:
+        # Complaints scattered around listing-like places, so the counts vary across the city
+        places = synthetic_listings(200_000, seed=1)
+        pick = rng.integers(0, len(places), args.complaints)
+        complaints = pd.DataFrame({
+            "Latitude": places["latitude"].to_numpy()[pick] + rng.normal(0, .003, args.complaints),
+            "Longitude": places["longitude"].to_numpy()[pick] + rng.normal(0, .003, args.complaints),
+            "OFNS_DESC": pd.Categorical(rng.choice(OFFENSES, args.complaints))})
+        start = time.perf_counter()
+        grid = ComplaintGrid()
+        for first in range(0, len(complaints), CHUNK):
+            chunk = complaints.iloc[first:first + CHUNK]
+            grid.add(chunk["Latitude"], chunk["Longitude"], chunk["OFNS_DESC"])
+        built = time.perf_counter() - start
+
+    listings = synthetic_listings(args.listings, seed=2)
+    start = time.perf_counter()
+    density = crime_density(listings, grid, args.radius)
+    queried = time.perf_counter() - start
+
+    print(f"complaints:      {int(grid.counts[0].sum())} ({grid.outside} outside the grid)")
+    print(f"grid:            {grid.shape[0]} x {grid.shape[1]} cells of {grid.cell_metres} m, "
+          f"{len(grid.counts)} layers")
+    print(f"grid build:      {built:.2f} s" + ("" if args.crime else f" ({args.complaints / built / 1e6:.1f} M complaints/s)"))
+    print(f"radius queries:  {queried:.2f} s for {args.listings} listings x {len(args.radius)} radii")
+
+    if complaints is not None and args.check:
+        lats, lons = complaints["Latitude"].to_numpy(), complaints["Longitude"].to_numpy()
+        sample = listings.sample(args.check, random_state=0)
+        for radius in args.radius:
+            exact = np.array([(haversine(lat, lon, lats, lons) <= radius / 1000).sum()
+                              for lat, lon in zip(sample["latitude"], sample["longitude"])])
+            estimate = density.loc[sample.index, density_column(radius)].to_numpy()
+            error = np.abs(estimate - exact) / np.maximum(exact, 1)
+            print(f"{radius:5d} m: mean relative error {error.mean():.3f}, total bias "
+                  f"{(estimate - exact).sum() / max(exact.sum(), 1):+.3f}")
+
+
+if __name__ == "__main__":
+    main()
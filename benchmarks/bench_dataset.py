@@ -0,0 +1,86 @@
+"""Per-process cost of loading the dataset: Parquet decode vs. memory-mapped Arrow.
+
+    python -m benchmarks.bench_dataset [--rows 1000000] [--processes 4]
+
+Each worker process loads the frame and reads every numeric column, as the
+app's indexes do, then waits for the others before measuring: with the
+workers alive together, pages of the mapped file are shared between them and
+only their proportional share (PSS) is charged to each. Memory is read from
+``/proc/self/smaps_rollup`` (Linux 4.14+).
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from airbnb.dataset import load_dataset, write_artifact
+from benchmarks.synthetic import synthetic_listings
+
+
+def parquet_loader(path):
+    return pd.read_parquet(path, engine="pyarrow")
+
+
+def memory():
+    """Unique (private) and proportional set sizes of this process, in bytes."""
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            if value.strip().endswith("kB"):
+                fields[name] = int(value.split()[0]) * 1024
+    return fields["Private_Clean"] + fields["Private_Dirty"], fields["Pss"]
+
+
+def load_in_worker(loader, path, barrier, results):
+    uss, pss = memory()
+    start = time.perf_counter()
+    df = loader(path)
+    df.select_dtypes("number").sum()
+    elapsed = time.perf_counter() - start
+    barrier.wait()
+    after = memory()
+    results.put((elapsed, after[0] - uss, after[1] - pss))
+    barrier.wait()
+
+
+def run(loader, path, processes):
+    results = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(processes)
+    workers = [multiprocessing.Process(target=load_in_worker, args=(loader, path, barrier, results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    stats = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "listings.parquet")
+        df = synthetic_listings(args.rows)
+        write_artifact(df, path)
+        print(f"rows: {len(df)}, frame: {df.memory_usage(deep=True).sum() / 2**20:.1f} MB")
+        del df
+
+        print(f"{'loader':<10}{'load ms':>10}{'USS MB':>10}{'PSS MB':>10}")
+        for name, loader in [("parquet", parquet_loader), ("mapped", load_dataset)]:
+            stats = run(loader, path, args.processes)
+            elapsed = sum(s[0] for s in stats) / len(stats)
+            uss = sum(s[1] for s in stats) / len(stats)
+            pss = sum(s[2] for s in stats) / len(stats)
+            print(f"{name:<10}{elapsed * 1000:>10.1f}{uss / 2**20:>10.1f}{pss / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
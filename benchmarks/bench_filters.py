@@ -0,0 +1,71 @@
+"""Dashboard filters: ``df.query`` strings vs. FilterIndex.select.
+
+    python -m benchmarks.bench_filters [--data data/New_York_Airbnb.parquet] [--rows 49000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from airbnb.dataset import load_dataset, optimize_dtypes
+from airbnb.filters import FilterIndex
+from benchmarks.synthetic import synthetic_listings
+
+# (name, app query string, equivalent predicates)
+CASES = [
+    ("map filters", "price.between(400.0, 1500.0) and minimum_nights<=1 and number_of_reviews>=0",
+     dict(price=(400., 1500.), minimum_nights=(None, 1), number_of_reviews=(0, None))),
+    ("price histogram", "price.between(50.0, 300.0)", dict(price=(50., 300.))),
+    ("availability", "neighbourhood_group=='Manhattan' and price<100 and availability_365>0",
+     dict(neighbourhood_group="Manhattan", price=(None, 99), availability_365=(1, None))),
+    ("minimum nights box", "minimum_nights<15", dict(minimum_nights=(None, 14))),
+    ("distance scatter", "distance_to_nearest_subway>=0.1 & distance_to_nearest_subway<=3.0",
+     dict(distance_to_nearest_subway=(0.1, 3.))),
+]
+
+
+def best_of(func, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def read_data(path):
+    """A built dataset: the Parquet artifact (served mapped, as the app does) or a CSV export of it."""
+    if path.endswith(".csv"):
+        return optimize_dtypes(pd.read_csv(path))
+    if not path.endswith(".parquet"):
+        raise SystemExit("--data must be a .parquet or .csv file: %s" % path)
+    return load_dataset(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", help="built dataset (Parquet or CSV)")
+    parser.add_argument("--rows", type=int, default=49000)
+    args = parser.parse_args()
+
+    df = read_data(args.data) if args.data else synthetic_listings(args.rows)
+
+    start = time.perf_counter()
+    index = FilterIndex(df)
+    print(f"rows: {len(df)}, index build: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"{'case':<20}{'query ms':>10}{'select ms':>11}{'cached ms':>11}{'rows':>9}")
+
+    for name, query, predicates in CASES:
+        expected = np.flatnonzero(df.eval(query).to_numpy())
+        rows = index._select(tuple(sorted(predicates.items())))
+        assert np.array_equal(expected, rows), name
+
+        queried = best_of(lambda: df.query(query))
+        uncached = best_of(lambda: index._select(tuple(sorted(predicates.items()))))
+        cached = best_of(lambda: index.select(**predicates))
+        print(f"{name:<20}{queried * 1000:>10.3f}{uncached * 1000:>11.3f}{cached * 1000:>11.4f}{len(rows):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Scaling of the pipeline build from 1 to N worker processes, on synthetic inputs.
+
+    python -m benchmarks.bench_pipeline [--rows 500000] [--complaints 5000000] [--workers 1 2 4 8]
+
+Every run starts from an empty stage cache. Prints the wall time of each
+stage and of the whole build, and the speedup over one worker.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from airbnb.cache import StageCache
+from airbnb.pipeline import build_graph
+from airbnb.scheduler import WorkerPool, available_cores
+from airbnb.subway import SUBWAY_PATH
+from benchmarks.synthetic import GEOJSON_PATH, synthetic_complaints, synthetic_listings
+
+
+def write_inputs(rows, complaints, directory):
+    """Raw listings (the columns of ``AB_NYC_2019.csv``) and complaints CSVs."""
+    listings = synthetic_listings(rows).drop(columns=["distance_to_nearest_subway", "crimes"])
+    listings.insert(0, "id", range(len(listings)))
+    listings.insert(1, "name", "Listing")
+    listings["last_review"] = "2019-06-01"
+    paths = {"listings": os.path.join(directory, "listings.csv"), "crime": os.path.join(directory, "complaints.csv")}
+    listings.to_csv(paths["listings"], index=False)
+    synthetic_complaints(complaints, paths["crime"])
+    return paths
+
+
+def main():
+    cores = available_cores()
+    default_workers = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--complaints", type=int, default=5_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        paths = write_inputs(args.rows, args.complaints, directory)
+        print(f"inputs: {args.rows} listings, {args.complaints} complaints written in "
+              f"{time.perf_counter() - start:.1f} s; {cores} cores available")
+
+        runs = []
+        for workers in args.workers:
+            cache = StageCache(os.path.join(directory, "cache-%d" % workers))
+            start = time.perf_counter()
+            with WorkerPool(workers) as pool:
+                graph = build_graph(paths["listings"], SUBWAY_PATH, paths["crime"], 2019,
+                                    os.path.join(directory, "out-%d.parquet" % workers), None, cache,
+                                    GEOJSON_PATH, [500], pool)
+                graph.run()
+            runs.append((workers, time.perf_counter() - start, graph.timings))
+
+        stages = list(runs[0][2])
+        print(f"{'workers':>7}" + "".join(f"{stage:>16}" for stage in stages) + f"{'total':>10}{'speedup':>9}")
+        for workers, total, timings in runs:
+            print(f"{workers:>7}" + "".join(f"{timings[s][1] - timings[s][0]:>16.2f}" for s in stages)
+                  + f"{total:>10.2f}{runs[0][1] / total:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""Load test of the dashboard with concurrent simulated browser sessions.
+
+    python -m benchmarks.bench_sessions [--sessions 1 5 10 20] [--seconds 60] [--output results.json]
+    python -m benchmarks.bench_sessions --url http://127.0.0.1:8501 --pid 1234
+    python -m benchmarks.bench_sessions --compare baseline.json results.json
+
+Unless ``--url`` points at a running app, starts ``streamlit run app.py``
+headless (extra ``--option server.x=y`` and ``--env NAME=VALUE`` are passed
+to it, to compare configurations). Each session speaks the browser's
+websocket protocol: it opens the app, then loops over ``SCENARIO``. The
+scenario switches sections, drags the price, reviews and distance sliders,
+flips the district radio and the availability checkbox, and picks map
+styles. The browser sends a dragged slider's value at most every
+``DRAG_INTERVAL`` seconds; each value starts a rerun that interrupts the
+previous one. For every interaction the harness records the time from the
+last message sent to the end of the rerun it started, and the bytes
+received. Sessions pause ``--think`` seconds (exponentially distributed)
+between interactions.
+
+Each ``--sessions`` level reports latency percentiles and KB received per
+interaction, plus the server's CPU use (cores) and peak RSS, read from
+``/proc`` for the started server or ``--pid``.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import aiohttp
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+PORT = 8621
+
+DRAG_INTERVAL = 0.2
+
+WIDGET_TYPES = {"slider", "radio", "selectbox", "checkbox"}
+
+# (action, widget label, argument): "select" takes an option, "drag" the fraction of the slider range the last
+# handle moves to and "toggle" nothing. Labels shared by two widgets of a section are told apart with "#2".
+SCENARIO = [
+    ("select", "Secció", "Localització"),
+    ("drag", "Price Range ($)", .15),
+    ("drag", "Minimum Reviews", .05),
+    ("drag", "Price Range ($)", .4),
+    ("select", "Secció", "Preu"),
+    ("drag", "Price range", .5),
+    ("select", "What type of map do you want to see?", "Stamen Toner"),
+    ("drag", "Price range#2", .7),
+    ("select", "Secció", "Disponibilitat"),
+    ("select", "District", "Manhattan"),
+    ("toggle", "Expensive Listings", None),
+    ("select", "District", "Queens"),
+    ("select", "Secció", "Metro"),
+    ("drag", "Distance to Subway Station (km)", .3),
+    ("select", "What type of map do you want to see?", "Stamen Terrain"),
+    ("drag", "Distance range", .6),
+]
+
+# Sessions start at one of the section changes, so every later step finds its widget
+SECTION_STEPS = [i for i, (_, label, _) in enumerate(SCENARIO) if label == "Secció"]
+
+
+def start_app(port, options=(), env=()):
+    command = [sys.executable, "-m", "streamlit", "run", "app.py", "--server.headless", "true",
+               "--server.port", str(port), "--browser.gatherUsageStats", "false"]
+    for option in options:
+        name, value = option.split("=", 1)
+        command += ["--" + name, value]
+    return subprocess.Popen(command, env=dict(os.environ, **dict(item.split("=", 1) for item in env)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_ready(http, url, timeout=300):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with http.get(url + "/healthz") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("app at %s did not start" % url)
+        await asyncio.sleep(0.5)
+
+
+class ProcessSampler:
+    """CPU time and RSS of a process, sampled from ``/proc`` (Linux)."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak_rss_mb = 0.
+        self.available = pid is not None and os.path.exists("/proc/%d/stat" % pid)
+
+    def cpu_seconds(self):
+        with open("/proc/%d/stat" % self.pid) as f:
+            # Fields after the command name, which may contain spaces; utime and stime are the 14th and 15th
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def sample_rss(self):
+        with open("/proc/%d/statm" % self.pid) as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+
+    async def run(self, stop, interval=0.25):
+        while not stop.is_set():
+            self.sample_rss()
+            await asyncio.sleep(interval)
+
+
+class Session:
+    """One browser tab: the websocket, the widgets of the last run and the values the browser would send."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.widgets = {}
+        self.states = {}
+        self.finished = asyncio.Queue()
+        self.bytes = 0
+        self.exceptions = 0
+        self.runs_started = 0
+        self.last_sent_run = 0
+        self._run_widgets = {}
+
+    async def receive(self):
+        async for message in self.ws:
+            if message.type != aiohttp.WSMsgType.BINARY:
+                continue
+            self.bytes += len(message.data)
+            msg = ForwardMsg()
+            msg.ParseFromString(message.data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.runs_started += 1
+                self._run_widgets = {}
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._add_element(msg.delta.new_element)
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                    # The browser only keeps the state of the widgets the last complete run drew
+                    self.widgets = self._run_widgets
+                    ids = {widget.id for _, widget in self.widgets.values()}
+                    self.states = {id_: state for id_, state in self.states.items() if id_ in ids}
+                self.finished.put_nowait((msg.script_finished, self.runs_started))
+
+    def _add_element(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.exceptions += 1
+        if kind not in WIDGET_TYPES:
+            return
+        widget = getattr(element, kind)
+        label, n = widget.label, 2
+        while label in self._run_widgets:
+            label, n = "%s#%d" % (widget.label, n), n + 1
+        self._run_widgets[label] = (kind, widget)
+
+    async def rerun(self):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        self.last_sent_run = self.runs_started
+        await self.ws.send_bytes(msg.SerializeToString())
+
+    async def wait_finished(self):
+        """Wait for the end of the first run started after the last rerun request.
+
+        Runs started before it are interrupted by it, or finish before the
+        server reads it; either way they are skipped. (A run that started
+        just before the request arrived, and finished first, is a race the
+        browser cannot tell apart either.)
+        """
+        while True:
+            status, run = await self.finished.get()
+            if status != ForwardMsg.FINISHED_EARLY_FOR_RERUN and run > self.last_sent_run:
+                return status
+
+    def set_value(self, widget_id, field, value):
+        state = WidgetState(id=widget_id)
+        if field == "double_array_value":
+            state.double_array_value.data.extend(value)
+        else:
+            setattr(state, field, value)
+        self.states[widget_id] = state
+
+    def current_value(self, kind, widget):
+        state = self.states.get(widget.id)
+        if kind == "slider":
+            return list(state.double_array_value.data) if state else list(widget.default)
+        if kind == "checkbox":
+            return state.bool_value if state else widget.default
+        return state.int_value if state else widget.default
+
+    def steps(self, action, label, argument):
+        """Widget values the browser sends for an interaction, in order."""
+        if label not in self.widgets:
+            raise KeyError("no widget %r in this section" % label)
+        kind, widget = self.widgets[label]
+        if action == "select":
+            return [(widget.id, "int_value", list(widget.options).index(argument))]
+        if action == "toggle":
+            return [(widget.id, "bool_value", not self.current_value(kind, widget))]
+
+        values = self.current_value(kind, widget)
+        target = widget.min + argument * (widget.max - widget.min)
+        # One value per DRAG_INTERVAL of a drag lasting about a second
+        steps = []
+        for position in np.linspace(values[-1], target, 6)[1:]:
+            position = round(position / widget.step) * widget.step if widget.step else position
+            # The upper handle of a range slider stops at the lower one
+            steps.append((widget.id, "double_array_value", values[:-1] + [max([position] + values[:-1])]))
+        return steps
+
+
+async def simulate(url, deadline, think, records, errors, offset):
+    async with aiohttp.ClientSession() as http:
+        async with http.ws_connect(url.replace("http", "ws", 1) + "/stream", max_msg_size=0) as ws:
+            session = Session(ws)
+            receiver = asyncio.ensure_future(session.receive())
+            try:
+                start, received = time.perf_counter(), session.bytes
+                await session.rerun()
+                await session.wait_finished()
+                records["open app"].append((time.perf_counter() - start, session.bytes - received))
+
+                i = offset
+                while time.perf_counter() < deadline:
+                    action, label, argument = SCENARIO[i % len(SCENARIO)]
+                    i += 1
+                    try:
+                        steps = session.steps(action, label, argument)
+                    except KeyError:
+                        # The section no longer draws a widget with this label
+                        errors["missing widget %s" % label] += 1
+                        continue
+                    received = session.bytes
+                    for n, (widget_id, field, value) in enumerate(steps):
+                        if n:
+                            await asyncio.sleep(DRAG_INTERVAL)
+                        session.set_value(widget_id, field, value)
+                        start = time.perf_counter()
+                        await session.rerun()
+                    await session.wait_finished()
+                    records["%s %s" % (action, label)].append((time.perf_counter() - start, session.bytes - received))
+                    await asyncio.sleep(random.expovariate(1 / think) if think else 0)
+            finally:
+                receiver.cancel()
+                errors["exceptions shown"] += session.exceptions
+
+
+async def load(url, sessions, seconds, think, pid):
+    records = collections.defaultdict(list)
+    errors = collections.Counter()
+    sampler = ProcessSampler(pid)
+    async with aiohttp.ClientSession() as http:
+        await wait_ready(http, url)
+    stop = asyncio.Event()
+    sampling = asyncio.ensure_future(sampler.run(stop)) if sampler.available else None
+    cpu_start = sampler.cpu_seconds() if sampler.available else None
+
+    started = time.perf_counter()
+    # Sessions start over the first second and at different scenario steps, like independent visitors
+    deadline = started + seconds
+    tasks = []
+    for i in range(sessions):
+        offset = SECTION_STEPS[i % len(SECTION_STEPS)]
+        tasks.append(asyncio.ensure_future(simulate(url, deadline, think, records, errors, offset)))
+        await asyncio.sleep(1 / sessions)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    server = {}
+    if sampling is not None:
+        await sampling
+        server = {"cpu_cores": (sampler.cpu_seconds() - cpu_start) / elapsed, "peak_rss_mb": sampler.peak_rss_mb}
+    return {"sessions": sessions, "seconds": elapsed, "errors": dict(errors), "server": server,
+            "interactions": summarize(records)}
+
+
+def summarize(records):
+    summary = {}
+    for name, values in records.items():
+        latencies = np.array([latency for latency, _ in values]) * 1000
+        summary[name] = {"count": len(values),
+                         "p50_ms": np.percentile(latencies, 50), "p95_ms": np.percentile(latencies, 95),
+                         "p99_ms": np.percentile(latencies, 99),
+                         "kb": np.mean([received for _, received in values]) / 1024}
+    return summary
+
+
+def report(result):
+    interactions = result["interactions"]
+    total = sum(stats["count"] for stats in interactions.values())
+    print(f"\n{result['sessions']} sessions, {total} interactions in {result['seconds']:.0f} s "
+          f"({total / result['seconds']:.1f}/s)")
+    print(f"  {'interaction':<52}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'KB':>9}")
+    for name, stats in sorted(interactions.items()):
+        print(f"  {name:<52}{stats['count']:>7}{stats['p50_ms']:>9.0f}{stats['p95_ms']:>9.0f}"
+              f"{stats['p99_ms']:>9.0f}{stats['kb']:>9.1f}")
+    if result["server"]:
+        print(f"  server: {result['server']['cpu_cores']:.2f} cores, peak RSS {result['server']['peak_rss_mb']:.0f} MB")
+    if result["errors"]:
+        print("  errors: " + ", ".join("%s x %d" % item for item in sorted(result["errors"].items())))
+
+
+def compare(baseline_path, results_path):
+    """p50 and p95 of each interaction relative to the baseline run, per session count."""
+    with open(baseline_path) as f:
+        baseline = {run["sessions"]: run for run in json.load(f)["runs"]}
+    with open(results_path) as f:
+        runs = json.load(f)["runs"]
+    print(f"{'sessions':>8}  {'interaction':<52}{'p50':>8}{'p95':>8}")
+    for run in runs:
+        base = baseline.get(run["sessions"])
+        if base is None:
+            continue
+        for name, stats in sorted(run["interactions"].items()):
+            if name not in base["interactions"]:
+                continue
+            p50 = stats["p50_ms"] / base["interactions"][name]["p50_ms"]
+            p95 = stats["p95_ms"] / base["interactions"][name]["p95_ms"]
+            flag = "  slower" if p95 > 1.2 else ""
+            print(f"{run['sessions']:>8}  {name:<52}{p50:>7.2f}x{p95:>7.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="app to load instead of starting one")
+    parser.add_argument("--pid", type=int, help="process of the app at --url, for CPU and RSS")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--think", type=float, default=1., help="mean pause between interactions, in seconds")
+    parser.add_argument("--option", action="append", default=[], help="streamlit option for the started app")
+    parser.add_argument("--env", action="append", default=[], help="environment variable for the started app")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"),
+                        help="compare two saved runs instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    app = None if args.url else start_app(PORT, args.option, args.env)
+    url = args.url or "http://127.0.0.1:%d" % PORT
+    try:
+        runs = []
+        for sessions in args.sessions:
+            runs.append(asyncio.run(load(url, sessions, args.seconds, args.think, app.pid if app else args.pid)))
+            report(runs[-1])
+    finally:
+        if app is not None:
+            app.terminate()
+            app.wait()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"options": args.option, "env": args.env, "runs": runs}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Nearest subway distance: notebook apply loop vs. SubwayIndex.
+
+    python -m benchmarks.bench_subway [--listings data/rawData/AB_NYC_2019.csv] [--rows 49000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from airbnb.subway import SUBWAY_PATH, SubwayIndex, haversine
+
+
+def legacy_find_nearest(x, station_locs):
+    # Copy of the notebook implementation, including the degrees passed to np.cos
+    R = 6373.0
+    lats0 = x['latitude']
+    long0 = x['longitude']
+    loc0 = np.radians(np.array([long0, lats0]).reshape(-1, 2))
+    dist = np.radians(station_locs) - loc0
+    lats_diff = dist[:, 1]
+    long_diff = dist[:, 0]
+    a = (np.sin(lats_diff/2))**2 + np.cos(lats0) * np.cos(station_locs[:, 1]) * (np.sin(long_diff / 2))**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return min(R * c)
+
+
+def synthetic_listings(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"latitude": rng.uniform(40.50, 40.91, rows),
+                         "longitude": rng.uniform(-74.24, -73.71, rows)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", help="listings CSV with latitude/longitude columns")
+    parser.add_argument("--rows", type=int, default=49000)
+    args = parser.parse_args()
+
+    if args.listings:
+        df = pd.read_csv(args.listings, usecols=["latitude", "longitude"])
+    else:
+        df = synthetic_listings(args.rows)
+
+    start = time.perf_counter()
+    index = SubwayIndex.from_csv(SUBWAY_PATH)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast = index.nearest_distance(df["latitude"], df["longitude"])
+    indexed = time.perf_counter() - start
+
+    station_locs = index.stations[["longitude", "latitude"]].to_numpy()
+    start = time.perf_counter()
+    legacy = df.apply(lambda x: legacy_find_nearest(x, station_locs), axis=1).to_numpy()
+    looped = time.perf_counter() - start
+
+    exact = haversine(df["latitude"].to_numpy()[:, None], df["longitude"].to_numpy()[:, None],
+                      index.stations["latitude"].to_numpy()[None, :],
+                      index.stations["longitude"].to_numpy()[None, :]).min(axis=1)
+
+    print(f"listings:           {len(df)}")
+    print(f"stations:           {len(index.stations)}")
+    print(f"index build:        {build * 1000:.1f} ms")
+    print(f"SubwayIndex query:  {indexed * 1000:.1f} ms")
+    print(f"apply(find_nearest): {looped * 1000:.1f} ms ({looped / indexed:.0f}x slower)")
+    print(f"max |index - exact haversine|:  {np.abs(fast - exact).max() * 1000:.6f} m")
+    print(f"max |legacy - exact haversine|: {np.abs(legacy - exact).max() * 1000:.1f} m")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Benchmark suite of the pipeline and dashboard hot paths at several dataset sizes.
+
+    python -m benchmarks.suite [--rows 50000 500000 5000000] [--cases filter] [--output results.json]
+    python -m benchmarks.suite --compare baseline.json results.json
+
+For each size, synthetic listings (real polygons and subway stations) and as
+many complaints are written to a temporary directory. Then every case is run:
+dataset loading, nearest subway, crime aggregation, the dashboard's groupby
+blocks (raw and from the aggregate cube), its filters, and figure and map
+construction. Each case is timed over ``--repeat`` runs, then run once more
+under tracemalloc for its peak traced memory (numpy buffers included) and the
+memory and allocated blocks it leaves behind. Python keeps no total
+allocation counter, so blocks are counted net, with the case's result still
+alive.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import folium
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from folium.plugins import HeatMap
+
+from airbnb.aggregates import DIMENSIONS, MEASURES, AggregateCube
+from airbnb.binning import SpatialBins
+from airbnb.crime import aggregate_complaints
+from airbnb.dataset import load_dataset, write_artifact
+from airbnb.filters import FilterIndex
+from airbnb.hosts import HostRanking
+from airbnb.histograms import BinnedHistogram
+from airbnb.geometry import CHOROPLETH_ZOOM, simplified_neighbourhoods, with_metrics
+from airbnb.sampling import decimate
+from airbnb.sketches import CellSketches
+from airbnb.subway import SUBWAY_PATH, SubwayIndex
+from benchmarks.bench_filters import CASES as FILTER_CASES
+from benchmarks.synthetic import synthetic_complaints, synthetic_listings
+
+ROWS = [50000, 500000, 5000000]
+
+# The per-rerun groupby blocks of the original main(), as (name, function of the listings frame)
+GROUPBY_BLOCKS = [
+    ("price by neighbourhood", lambda df: df.groupby("neighbourhood", observed=True)["price"].mean()),
+    ("price by district", lambda df: df.groupby("neighbourhood_group", observed=True)["price"].mean()),
+    ("room types by district", lambda df: df.groupby(["neighbourhood_group", "room_type"], observed=True).size()),
+    ("price by room type", lambda df: df.groupby("room_type", observed=True)["price"].mean()),
+    ("price by district and room type",
+     lambda df: df.groupby(["neighbourhood_group", "room_type"], observed=True)["price"].mean()),
+    ("reviews by host", lambda df: df.groupby("host_name", observed=True)["number_of_reviews"].count()),
+    ("distance by neighbourhood", lambda df: df.groupby(["neighbourhood_group", "neighbourhood"],
+                                                        observed=True)["distance_to_nearest_subway"].mean()),
+]
+
+# Indexes over the listings that cases need built before they are timed
+INDEXES = {
+    "subway": lambda df: SubwayIndex.from_csv(SUBWAY_PATH),
+    "cube": AggregateCube,
+    "filters": FilterIndex,
+    "bins": SpatialBins,
+    "hosts": HostRanking,
+    "sketches": lambda df: CellSketches(df, DIMENSIONS, MEASURES),
+    "histogram": lambda df: BinnedHistogram(df, "price"),
+}
+
+# The same blocks read from the aggregate cube
+CUBE_BLOCKS = [
+    ("price by neighbourhood", ("neighbourhood", "price")),
+    ("price by district", ("neighbourhood_group", "price")),
+    ("room types by district", (["neighbourhood_group", "room_type"], "count")),
+    ("price by room type", ("room_type", "price")),
+    ("price by district and room type", (["neighbourhood_group", "room_type"], "price")),
+    ("distance by neighbourhood", (["neighbourhood_group", "neighbourhood"], "distance_to_nearest_subway")),
+]
+
+
+def prepare(rows, directory):
+    """Write the inputs for one dataset size; returns the paths and the loaded objects."""
+    df = synthetic_listings(rows)
+    paths = {"csv": os.path.join(directory, "listings.csv"),
+             "parquet": os.path.join(directory, "listings.parquet"),
+             "complaints": os.path.join(directory, "complaints.csv"),
+             "missing": os.path.join(directory, "missing.parquet")}
+    df.to_csv(paths["csv"], index=False)
+    write_artifact(df, paths["parquet"])
+    synthetic_complaints(rows, paths["complaints"])
+    return {"rows": rows, "paths": paths, "df": load_dataset(paths["parquet"])}
+
+
+def build_indexes(ctx, names):
+    """Add the indexes a case needs to ``ctx``, so filtered runs only build what they use."""
+    for name in names:
+        if name not in ctx:
+            ctx[name] = INDEXES[name](ctx["df"])
+
+
+def choropleth_html(cube, metric):
+    key = "polygon_id" if cube.has("polygon_id") else "neighbourhood"
+    metrics = cube.frame(key, metric)
+    geo = with_metrics(simplified_neighbourhoods(CHOROPLETH_ZOOM), metrics, key=key)
+    map_ny = folium.Map(location=[40.7128, -73.9354], zoom_start=CHOROPLETH_ZOOM)
+    folium.Choropleth(geo_data=geo, data=metrics, columns=[key, metric], key_on="feature.properties." + key,
+                      fill_color="YlOrRd").add_to(map_ny)
+    return folium.Figure().add_child(map_ny).render()
+
+
+def heatmap_html(bins):
+    map_ny = folium.Map([40.7128, -73.9354], zoom_start=10.7)
+    HeatMap(bins.aggregate(budget=5000)[["latitude", "longitude", "weight"]], radius=8).add_to(map_ny)
+    return folium.Figure().add_child(map_ny).render()
+
+
+def histogram_figure(counts):
+    bars = go.Bar(x=counts["price"] + counts["width"] / 2, y=counts["count"], width=counts["width"])
+    return go.Figure(bars).to_json()
+
+
+def cases(ctx):
+    """``(name, indexes needed, function[, setup])`` of every case for one dataset size.
+
+    A case with a ``setup`` is called with its result, built untimed before each run.
+    """
+    df, paths = ctx["df"], ctx["paths"]
+    result = [
+        ("load csv", (), lambda: load_dataset(paths["missing"], paths["csv"])),
+        ("load parquet", (), lambda: pd.read_parquet(paths["parquet"], engine="pyarrow")),
+        ("load mapped", (), lambda: load_dataset(paths["parquet"])),
+        ("subway index build", (), lambda: SubwayIndex.from_csv(SUBWAY_PATH)),
+        ("subway nearest", ("subway",), lambda: ctx["subway"].nearest_distance(df["latitude"], df["longitude"])),
+        ("crime aggregation", (), lambda: aggregate_complaints(paths["complaints"], 2019)),
+        ("aggregate cube build", (), lambda: AggregateCube(df)),
+        ("filter index build", (), lambda: FilterIndex(df)),
+        ("spatial bins build", (), lambda: SpatialBins(df)),
+        ("host ranking build", (), lambda: HostRanking(df)),
+        ("host top 10 by reviews", ("hosts",), lambda: ctx["hosts"]._select("reviews", 10)),
+        ("host top 10 by revenue", ("hosts",), lambda: ctx["hosts"]._select("revenue", 10)),
+        # On a ranking of its own, rebuilt before every run, so the shared one keeps the dataset's totals
+        ("host ranking add 1000", (), lambda ranking: ranking.add(df.iloc[:1000]), lambda: HostRanking(df)),
+        ("quantile sketches build", (), lambda: CellSketches(df, DIMENSIONS, MEASURES)),
+        ("box minimum nights exact", (),
+         lambda: df[df["minimum_nights"] <= 14].groupby("neighbourhood_group", observed=True)["minimum_nights"]
+         .describe()),
+        ("box minimum nights sketched", ("sketches",),
+         lambda: ctx["sketches"].describe("minimum_nights", "neighbourhood_group", at_most=14)),
+        ("percentiles price sketched", ("sketches",),
+         lambda: ctx["sketches"].describe("price", "room_type", [.1, .25, .5, .75, .9, .99],
+                                          neighbourhood_group=["Brooklyn", "Queens"])),
+    ]
+    for name, block in GROUPBY_BLOCKS:
+        result.append(("groupby " + name, (), lambda block=block: block(df)))
+    for name, (dims, measure) in CUBE_BLOCKS:
+        result.append(("cube " + name, ("cube",), lambda dims=dims, measure=measure: ctx["cube"].frame(dims, measure)))
+    for name, query, predicates in FILTER_CASES:
+        key = tuple(sorted(predicates.items()))
+        result.append(("query " + name, (), lambda query=query: df.query(query)))
+        result.append(("select " + name, ("filters",), lambda key=key: ctx["filters"]._select(key)))
+    result += [
+        ("figure price histogram", ("filters",),
+         lambda: px.histogram(df.take(ctx["filters"]._select((("price", (50., 300.)),))), x="price",
+                              nbins=20).to_json()),
+        ("binned histogram build", (), lambda: BinnedHistogram(df, "price")),
+        ("figure price histogram binned", ("histogram",),
+         lambda: histogram_figure(ctx["histogram"].histogram(50., 300., bins=20, per_group=False))),
+        ("box price binned", ("histogram",), lambda: ctx["histogram"].describe(50., 300.)),
+        ("figure price vs distance", (),
+         lambda: px.scatter(decimate(df, 30000, ["distance_to_nearest_subway", "price"]),
+                            x="distance_to_nearest_subway", y="price", color="neighbourhood_group",
+                            render_mode="webgl").to_json()),
+        ("map heatmap", ("bins",), lambda: heatmap_html(ctx["bins"])),
+        ("map choropleth", ("cube",), lambda: choropleth_html(ctx["cube"], "price")),
+    ]
+    return result
+
+
+def measure(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = (setup(),) if setup else ()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    result = func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated_blocks = sys.getallocatedblocks() - blocks
+    del result
+    return {"seconds_min": min(timings), "seconds_median": statistics.median(timings),
+            "peak_mb": peak / 2**20, "retained_mb": current / 2**20, "allocated_blocks": allocated_blocks}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "commit": commit,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def run(rows_list, pattern=None, repeat=3):
+    results = []
+    print(f"{'rows':>9}  {'case':<42}{'min ms':>11}{'median ms':>11}{'peak MB':>9}{'blocks':>10}")
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as directory:
+            ctx = prepare(rows, directory)
+            for name, indexes, func, *setup in cases(ctx):
+                if pattern and pattern not in name:
+                    continue
+                build_indexes(ctx, indexes)
+                stats = measure(func, repeat, *setup)
+                stats.update(rows=rows, case=name, rows_per_second=rows / stats["seconds_min"])
+                results.append(stats)
+                print(f"{rows:>9}  {name:<42}{stats['seconds_min'] * 1000:>11.2f}"
+                      f"{stats['seconds_median'] * 1000:>11.2f}{stats['peak_mb']:>9.1f}{stats['allocated_blocks']:>10}")
+            del ctx
+    return results
+
+
+def compare(baseline_path, results_path):
+    """Print the time and peak memory of each case relative to the baseline run."""
+    with open(baseline_path) as f:
+        baseline = {(r["rows"], r["case"]): r for r in json.load(f)["results"]}
+    with open(results_path) as f:
+        results = json.load(f)["results"]
+    print(f"{'rows':>9}  {'case':<42}{'time':>9}{'peak':>9}")
+    for result in results:
+        base = baseline.get((result["rows"], result["case"]))
+        if base is None:
+            continue
+        time_ratio = result["seconds_min"] / base["seconds_min"]
+        peak_ratio = result["peak_mb"] / base["peak_mb"] if base["peak_mb"] else float("nan")
+        flag = "  slower" if time_ratio > 1.1 else ""
+        print(f"{result['rows']:>9}  {result['case']:<42}{time_ratio:>8.2f}x{peak_ratio:>8.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=ROWS)
+    parser.add_argument("--cases", help="only run the cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "RESULTS"),
+                        help="compare two saved runs instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run(args.rows, args.cases, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
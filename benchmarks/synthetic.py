@@ -0,0 +1,86 @@
+"""Synthetic listings with the schema of the built dataset, and NYPD complaints.
+
+Listings are placed inside the real ``neighbourhoods.geojson`` polygons (as
+random convex combinations of their vertices) so that neighbourhood,
+borough and coordinates stay consistent at any row count.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from airbnb.dataset import optimize_dtypes
+
+GEOJSON_PATH = "data/rawData/neighbourhoods.geojson"
+
+ROOM_TYPES = ["Entire home/apt", "Private room", "Shared room"]
+
+OFFENSES = ["PETIT LARCENY", "HARRASSMENT 2", "ASSAULT 3 & RELATED OFFENSES", "CRIMINAL MISCHIEF & RELATED OF",
+            "GRAND LARCENY", "FELONY ASSAULT", "DANGEROUS DRUGS", "ROBBERY", "BURGLARY", "OFF. AGNST PUB ORD SENSBLTY &"]
+
+BOROUGH_CRIMES = {"Bronx": 96712, "Brooklyn": 130286, "Manhattan": 118385, "Queens": 95183, "Staten Island": 17982}
+
+
+def synthetic_listings(rows, seed=0, geojson_path=GEOJSON_PATH):
+    rng = np.random.default_rng(seed)
+    with open(geojson_path) as f:
+        features = json.load(f)["features"]
+
+    rings = [np.asarray(feature["geometry"]["coordinates"][0][0]) for feature in features]
+    feature = rng.integers(0, len(features), rows)
+
+    lons = np.empty(rows)
+    lats = np.empty(rows)
+    for i, ring in enumerate(rings):
+        picked = np.flatnonzero(feature == i)
+        if not len(picked):
+            continue
+        vertices = ring[rng.integers(0, len(ring), (len(picked), 3))]
+        weights = rng.dirichlet(np.ones(3), len(picked))[:, :, None]
+        lons[picked], lats[picked] = (vertices * weights).sum(axis=1).T
+
+    boroughs = np.array([f["properties"]["neighbourhood_group"] for f in features])[feature]
+    hosts = rng.zipf(1.6, rows) % max(rows // 3, 1)
+    df = pd.DataFrame({
+        "host_id": hosts * 7919 + 2787,
+        "host_name": np.char.add("Host", (hosts % 12000).astype(str)),
+        "neighbourhood_group": boroughs,
+        "neighbourhood": np.array([f["properties"]["neighbourhood"] for f in features])[feature],
+        "latitude": lats.round(5),
+        "longitude": lons.round(5),
+        "room_type": rng.choice(ROOM_TYPES, rows, p=[.52, .45, .03]),
+        "price": np.minimum(rng.lognormal(4.7, 0.7, rows), 10000).astype(int),
+        "minimum_nights": rng.choice([1, 2, 3, 4, 5, 7, 14, 30], rows, p=[.26, .24, .16, .07, .07, .08, .04, .08]),
+        "number_of_reviews": rng.negative_binomial(0.6, 0.025, rows).clip(0, 629),
+        "reviews_per_month": rng.gamma(1., 1.4, rows).round(2),
+        "calculated_host_listings_count": rng.integers(1, 5, rows),
+        "availability_365": np.where(rng.random(rows) < .36, 0, rng.integers(1, 366, rows)),
+        "distance_to_nearest_subway": rng.gamma(1.3, 0.5, rows),
+    })
+    df["crimes"] = df["neighbourhood_group"].map(BOROUGH_CRIMES)
+    return optimize_dtypes(df)
+
+
+def synthetic_complaints(rows, path, seed=0, geojson_path=GEOJSON_PATH):
+    """Write ``rows`` complaints from 2015-2019 in the column layout of the NYPD CSV.
+
+    Complaints are placed like listings (inside the borough polygons); a few
+    percent have no borough, as in the real file.
+    """
+    rng = np.random.default_rng(seed)
+    places = synthetic_listings(rows, seed=seed + 1, geojson_path=geojson_path)
+    boroughs = places["neighbourhood_group"].astype(str).str.upper().to_numpy(dtype=object)
+    boroughs[rng.random(rows) < .03] = None
+    dates = pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 5 * 365, rows), unit="D")
+    pd.DataFrame({
+        "CMPLNT_NUM": rng.permutation(rows) + 100000000,
+        "CMPLNT_FR_DT": dates.strftime("%m/%d/%Y"),
+        "CMPLNT_FR_TM": "12:00:00",
+        "ADDR_PCT_CD": rng.integers(1, 124, rows),
+        "BORO_NM": boroughs,
+        "LAW_CAT_CD": rng.choice(["MISDEMEANOR", "FELONY", "VIOLATION"], rows, p=[.57, .3, .13]),
+        "OFNS_DESC": rng.choice(OFFENSES, rows),
+        "PREM_TYP_DESC": rng.choice(["STREET", "RESIDENCE - APT. HOUSE", "RESIDENCE-HOUSE"], rows),
+        "Latitude": places["latitude"].to_numpy(),
+        "Longitude": places["longitude"].to_numpy(),
+    }).to_csv(path, index=False)
@@ -10,4 +10,7 @@ echo "\
 headless = true\n\
 enableCORS=false\n\
 port = $PORT\n\
-" > ~/.streamlit/config.toml
\ No newline at end of file
+" > ~/.streamlit/config.toml
+
+# Fill the data and figure caches before the server takes traffic; a failure only costs the first visits
+python -m airbnb.warmup || echo "warm-up failed, starting cold"